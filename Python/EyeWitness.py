@@ -2,6 +2,7 @@
 # PYTHON_ARGCOMPLETE_OK
 
 import argparse
+import copy
 try:
     import argcomplete
     from argcomplete.completers import FilesCompleter
@@ -11,6 +12,7 @@ except ImportError:
     FilesCompleter = None
 import glob
 import os
+import queue
 import re
 import shutil
 import signal
@@ -19,17 +21,26 @@ import time
 import webbrowser
 
 from modules import db_manager
+from modules.db_writer import DBWriter
+from modules.db_writer import WriterClient
 from modules import objects
 from modules import selenium_module
+from modules.browser_pool import TabPool
 from modules.helpers import class_info
 from modules.helpers import create_folders_css
 from modules.helpers import default_creds_category
-from modules.helpers import do_jitter
 from modules.helpers import target_creator
 from modules.helpers import title_screen
 from modules.helpers import open_file_input
 from modules.helpers import resolve_host
 from modules.helpers import duplicate_check
+from modules.preflight import run_preflight
+from modules.resolver import resolve_targets
+from modules.retry import RetryScheduler
+from modules.retry import retry_delay
+from modules.scheduler import HostScheduler
+from modules.supervisor import WorkerSupervisor
+from modules.supervisor import lease_seconds
 from modules.reporting import create_table_head
 from modules.reporting import create_web_index_head
 from modules.reporting import sort_data_and_write
@@ -76,18 +87,51 @@ def create_cli_parser():
     timing_options.add_argument('--timeout', metavar='Timeout', default=7, type=int,
                                 help='Maximum number of seconds to wait while\
                                  requesting a web page (Default: 7)')
+    timing_options.add_argument('--no-preflight', default=False,
+                                action='store_true',
+                                help='Skip the socket liveness check that \
+                                filters dead targets before screenshotting')
+    timing_options.add_argument('--preflight-threads', metavar='# of Threads',
+                                default=100, type=int,
+                                help='Concurrent pre-flight checks (Default: 100)')
     timing_options.add_argument('--jitter', metavar='# of Seconds', default=0,
-                                type=int, help='Randomize URLs and add a random\
-                                 delay between requests')
+                                type=int, help='Randomized minimum delay between\
+                                 requests to the same host')
+    timing_options.add_argument('--max-per-host', metavar='# of Requests', default=0,
+                                type=int, help='Most requests in flight to one host \
+                                at a time (default: 0, unlimited)')
+    timing_options.add_argument('--per-subnet', default=False, action='store_true',
+                                help='Apply --jitter and --max-per-host to each \
+                                IPv4 /24 instead of each host')
     timing_options.add_argument('--delay', metavar='# of Seconds', default=0,
-                                type=int, help='Delay between the opening of the navigator and taking the screenshot')
+                                type=int, help='Minimum seconds to wait after a page loads before taking the screenshot')
+    timing_options.add_argument('--ready-timeout', metavar='# of Seconds', default=3,
+                                type=float, help='Maximum seconds to wait for a loaded page to \
+                                settle (first paint, network quiet) before the screenshot (default: 3)')
     # Calculate default threads based on CPU cores (2 threads per core, max 20)
     default_threads = min(multiprocessing.cpu_count() * 2, 20)
     timing_options.add_argument('--threads', metavar='# of Threads', default=default_threads,
                                 type=int, help=f'Number of threads to use (default: {default_threads} based on CPU cores)')
+    timing_options.add_argument('--fast-timeout', metavar='# of Seconds',
+                                default=None, type=int,
+                                help='Run a first pass with this short timeout, then \
+                                retry hosts that timed out but answered with the \
+                                full --timeout in a second pass')
+    timing_options.add_argument('--slow-threads', metavar='# of Threads',
+                                default=None, type=int,
+                                help='Threads for the --fast-timeout second pass \
+                                (default: a quarter of --threads)')
+    timing_options.add_argument('--tabs', metavar='# of Tabs', default=1,
+                                type=int, help='Pages each thread\'s browser \
+                                loads concurrently (default: 1)')
+    timing_options.add_argument('--max-launches', metavar='# of Browsers',
+                                default=4, type=int,
+                                help='Browsers allowed to start up at the same \
+                                time (default: 4)')
     timing_options.add_argument('--max-retries', default=1, metavar='Max retries on \
                                 a timeout'.replace('    ', ''), type=int,
-                                help='Max retries on timeouts')
+                                help='Max retries for timeouts, resets and other \
+                                transient failures, with backoff (default: 1)')
 
     report_options = parser.add_argument_group('Report Output Options')
     d_arg = report_options.add_argument('-d', metavar='Output Directory',
@@ -98,6 +142,10 @@ def create_cli_parser():
         d_arg.completer = DirectoriesCompleter()
     report_options.add_argument('--results', metavar='Results/Page',
                                 default=25, type=int, help='Number of results per report page (default: 25)')
+    report_options.add_argument('--perceptual-dedup', default=False,
+                                action='store_true',
+                                help='Also merge near-identical screenshots when \
+                                deduplicating (requires Pillow)')
     report_options.add_argument('--no-prompt', default=False,
                                 action='store_true',
                                 help='Skip prompt to open report when complete')
@@ -119,6 +167,11 @@ def create_cli_parser():
                               type=int, help='Port of web proxy to go through')
     http_options.add_argument('--proxy-type', metavar='socks5', default="http",
                               help='Proxy type (socks5/http)')
+    http_options.add_argument('--header-source', default='browser',
+                              choices=['browser', 'request'],
+                              help='Read response headers from the browser\'s \
+                              own navigation, or make a separate HTTP request \
+                              (Default: browser)')
     http_options.add_argument('--show-selenium', default=False,
                               action='store_true', help='Show display for selenium')
     http_options.add_argument('--resolve', default=False,
@@ -137,11 +190,16 @@ def create_cli_parser():
                               help=("Comma-separated list of exclusive ports to "
                               "use (e.g. '80,8080')"))
     http_options.add_argument('--prepend-https', default=False, action='store_true',
-                              help='Prepend http:// and https:// to URLs without either')
+                              help='Prepend http:// and https:// to URLs without either \
+                              (pre-flight captures only the scheme each host serves)')
     http_options.add_argument('--validate-urls', default=False, action='store_true',
                               help='Only validate URLs without taking screenshots')
     http_options.add_argument('--skip-validation', default=False, action='store_true',
                               help='Skip URL validation checks (use with caution)')
+    http_options.add_argument('--validation-processes', metavar='# of Processes',
+                              default=0, type=int,
+                              help='Validate -f input on a pool of this many processes '
+                              '(Default: 0, validate in the main process)')
     http_options.add_argument('--selenium-log-path', default='./chromedriver.log', action='store',
                               help='Selenium ChromeDriver log path')
     http_options.add_argument('--cookies', metavar='key1=value1,key2=value2', default=None,
@@ -262,6 +320,11 @@ def create_cli_parser():
             print(" [*] Error: No valid DB file provided for resume!")
             sys.exit()
 
+    if args.tabs < 1:
+        print("[*] Error: --tabs must be at least 1")
+        parser.print_help()
+        sys.exit()
+
     if args.proxy_ip is not None and args.proxy_port is None:
         print("[*] Error: Please provide a port for the proxy!")
         parser.print_help()
@@ -334,25 +397,58 @@ def single_mode(cli_parsed):
             display.stop()
 
 
-def worker_thread(cli_parsed, targets, lock, counter, start_time, user_agent=None):
+def shows_life(http_object):
+    """True if a timed out target still answered in some way
+
+    The pre-flight connect succeeded, or the browser got a response or
+    headers back before the deadline.
+    """
+    return (http_object.preflight in ('http', 'open') or
+            http_object.status_code is not None or
+            bool(http_object.http_headers))
+
+
+def worker_thread(cli_parsed, targets, launch_slots, counter, start_time, user_agent=None,
+                  run_stats=None, events=None, writes=None):
     manager = None
     driver = None
     
     try:
         manager = db_manager.DB_Manager(cli_parsed.d + '/ew.db')
         manager.open_connection()
+        # Results go to the main process' DBWriter when there is one, this
+        # process then only ever reads from ew.db
+        store = manager if writes is None else WriterClient(writes)
 
         if cli_parsed.web:
-            create_driver = selenium_module.create_driver
             capture_host = selenium_module.capture_host
 
-        with lock:
-            driver = create_driver(cli_parsed, user_agent)
-        
-        while True:
-            http_object = targets.get()
-            if http_object is None:
-                break
+        # Browsers start concurrently, up to --max-launches at a time, and
+        # each worker takes targets as soon as its own browser is up
+        with launch_slots:
+            driver, launch_time = selenium_module.launch_driver(cli_parsed, user_agent)
+        print('[*] {0} browser ready in {1:.1f} seconds'.format(
+            current_process().name, launch_time))
+
+        lease = lease_seconds(cli_parsed)
+
+        def next_target(block=True):
+            while True:
+                # Raises queue.Empty if not blocking and nothing is queued
+                item = targets.get(block)
+                if item is None:
+                    return None
+                if user_agent is not None:
+                    http_object = item
+                    break
+                # http targets arrive as row ids, load only the one needed
+                # and lease it so the supervisor can take it back if we die
+                http_object = manager.get_http_object(item, incomplete=True)
+                if http_object is not None:
+                    if writes is not None:
+                        store.claim(item, current_process().name, lease)
+                    break
+                count_done(item)
             # Try to ensure object values are blank
             http_object._category = None
             http_object._default_creds = None
@@ -363,7 +459,6 @@ def worker_thread(cli_parsed, targets, lock, counter, start_time, user_agent=Non
             http_object.default_creds = None
             http_object.error_state = None
             http_object.page_title = None
-            http_object.resolved = None
             http_object.source_code = None
             # Fix our directory if its resuming from a different path
             if os.path.dirname(cli_parsed.d) != os.path.dirname(http_object.screenshot_path):
@@ -372,32 +467,76 @@ def worker_thread(cli_parsed, targets, lock, counter, start_time, user_agent=Non
 
             print('Attempting to screenshot {0}'.format(http_object.remote_system))
 
-            http_object.resolved = resolve_host(http_object.remote_system)
+            # Normally answered up front by resolver.resolve_targets
+            if http_object.resolved is None:
+                http_object.resolved = resolve_host(http_object.remote_system)
+            return http_object
+
+        max_retries = getattr(cli_parsed, 'max_retries', 0)
+        # Only the short-timeout first pass hands slow hosts to a later pass
+        defer_slow = getattr(cli_parsed, 'capture_pass', 1) == 1 and \
+            getattr(cli_parsed, 'fast_timeout', None) is not None
+
+        def record(http_object):
+            if defer_slow and user_agent is None and \
+                    http_object.error_state == 'Timeout' and shows_life(http_object):
+                print('[*] Deferring {0} to the slow pass'.format(
+                    http_object.remote_system))
+                store.defer_http_object(http_object, 2)
+                count_done(http_object.id)
+                return
+
+            if events is not None and user_agent is None:
+                delay = retry_delay(http_object.error_state,
+                                    http_object.retries or 0, max_retries)
+                if delay is not None:
+                    # Not final yet, the main process requeues it later
+                    http_object.retries = (http_object.retries or 0) + 1
+                    store.record_retry(http_object)
+                    print('[*] Retrying {0} in {1:.0f} seconds ({2})'.format(
+                        http_object.remote_system, delay, http_object.error_state))
+                    events.put(('retry', http_object.id, time.time() + delay))
+                    return
+
+            if http_object.category is None and http_object.error_state is None:
+                http_object = default_creds_category(http_object)
             if user_agent is None:
-                http_object, driver = capture_host(
-                    cli_parsed, http_object, driver)
-                if http_object.category is None and http_object.error_state is None:
-                    http_object = default_creds_category(http_object)
-                manager.update_http_object(http_object)
+                store.update_http_object(http_object)
             else:
-                ua_object, driver = capture_host(
-                    cli_parsed, http_object, driver)
-                if http_object.category is None and http_object.error_state is None:
-                    ua_object = default_creds_category(ua_object)
-                manager.update_ua_object(ua_object)
-
-            counter[0].value += 1
+                store.update_ua_object(http_object)
+            count_done(http_object.id)
+
+        def count_done(rowid):
+            if events is not None:
+                # Frees the host's slot in the main process' scheduler
+                events.put(('done', rowid))
+            # The main process waits for this to reach the total, so the
+            # increment must not race with other workers
+            with counter[0].get_lock():
+                counter[0].value += 1
+                done = counter[0].value
             
             # Show progress with ETA every 5 completions or at milestones
-            if counter[0].value % 5 == 0 or counter[0].value in [1, 10, 25, 50, 100]:
+            if done % 5 == 0 or done in [1, 10, 25, 50, 100]:
                 progress_msg = get_progress_message(
-                    counter[0].value, 
+                    done, 
                     counter[1], 
                     start_time.value if start_time.value > 0 else None
                 )
                 print(f'\x1b[32m{progress_msg}\x1b[0m')
-            
-            do_jitter(cli_parsed)
+
+        tabs = getattr(cli_parsed, 'tabs', 1)
+        if tabs > 1:
+            pool = TabPool(cli_parsed, driver, tabs, user_agent)
+            driver = pool.run(next_target, record)
+        else:
+            while True:
+                http_object = next_target()
+                if http_object is None:
+                    break
+                http_object, driver = capture_host(
+                    cli_parsed, http_object, driver)
+                record(http_object)
     except KeyboardInterrupt:
         pass
     except Exception as e:
@@ -407,6 +546,152 @@ def worker_thread(cli_parsed, targets, lock, counter, start_time, user_agent=Non
             manager.close()
         if driver:
             driver.quit()
+        if run_stats is not None:
+            # One entry per worker, summed by multi_mode
+            run_stats[current_process().name] = dict(selenium_module.driver_stats)
+
+
+def print_driver_summary(run_stats):
+    """Print browser restart and timeout recovery counts for the run"""
+    totals = {'launches': 0, 'launch_seconds': 0.0, 'restarts': 0, 'recoveries': 0}
+    for stats in run_stats.values():
+        for key in totals:
+            totals[key] += stats.get(key, 0)
+    if not totals['launches']:
+        return
+    average_launch = totals['launch_seconds'] / totals['launches']
+    print('[*] Browser restarts: {0}, timeouts recovered without a restart: {1}'.format(
+        totals['restarts'], totals['recoveries']))
+    if totals['recoveries']:
+        print('[*] Saved about {0:.1f} seconds of browser launches ({1:.1f}s average launch)'.format(
+            totals['recoveries'] * average_launch, average_launch))
+
+
+def dispatch_targets(supervisor, events, counter, total, pending, hosts, depth):
+    """Feed targets to the workers under the per-host limits until all are final
+
+    Returns once every target has a final result, or every worker is gone.
+
+    Args:
+        supervisor (WorkerSupervisor): Runs the workers and their work queues
+        events (Queue): ('done', id) and ('retry', id, due time) tuples sent
+            by the workers
+        counter (Value): Targets finished for good
+        total (int): Targets in this run
+        pending (iterator): Targets streamed from the DB, not yet scheduled
+        hosts (HostScheduler): Scheduled targets not handed out yet
+        depth (int): Ids out to each worker at a time, so none ever sits idle
+    """
+    # Targets read ahead of the workers. Only this window is in memory, it
+    # just has to be wide enough for the per-host limits to interleave.
+    lookahead = max(10000, depth * len(supervisor.workers) * 10)
+    retry_scheduler = RetryScheduler(hosts)
+
+    def handle_events(timeout=None):
+        try:
+            event = events.get_nowait() if timeout is None else events.get(timeout=timeout)
+            while True:
+                target = hosts.done(event[1])
+                if event[0] == 'retry' and target is not None:
+                    retry_scheduler.add(event[2], target)
+                event = events.get_nowait()
+        except queue.Empty:
+            pass
+
+    while True:
+        while len(hosts) < lookahead:
+            target = next(pending, None)
+            if target is None:
+                break
+            hosts.put(target)
+        retry_scheduler.release_due()
+        hosts.dispatch(supervisor.queues, depth)
+        handle_events(0.2)
+        if counter.value >= total and not len(retry_scheduler):
+            return
+        supervisor.check(hosts, counter, handle_events)
+        if not supervisor.alive():
+            return
+
+
+def run_capture_stage(cli_parsed, dbm, m, launch_slots, run_stats, max_threads,
+                      capture_pass=None):
+    """Capture the incomplete targets of one pass with a fresh set of workers
+
+    Args:
+        cli_parsed (ArgumentParser): Command Line Object for this pass
+        dbm (DB_Manager): Open database for the scan
+        m (SyncManager): Manager the shared queues are created in
+        launch_slots (Semaphore): Limits concurrent browser launches
+        run_stats (dict): Manager dict workers report browser stats into
+        max_threads (int): Most worker processes to start
+        capture_pass (int, optional): Only capture targets scheduled for
+            this pass (None captures every incomplete target)
+
+    Returns:
+        int: Number of targets the pass worked on
+    """
+    events = m.Queue()
+    multi_counter = multiprocessing.Value('i', 0)
+    start_time = m.Value('d', 0.0)  # Track start time for ETA
+
+    # --jitter is the spacing between requests to the same host
+    hosts = HostScheduler(getattr(cli_parsed, 'max_per_host', 0),
+                          getattr(cli_parsed, 'jitter', 0),
+                          getattr(cli_parsed, 'per_subnet', False))
+    if capture_pass == 1:
+        dbm.claim_first_pass()
+    multi_total = dbm.count_incomplete_http(capture_pass)
+    if multi_total == 0:
+        return 0
+    pending = dbm.iter_incomplete_targets(capture_pass)
+
+    # Each thread keeps up to tabs pages in flight
+    tabs = getattr(cli_parsed, 'tabs', 1)
+    needed_threads = -(-multi_total // tabs)
+    if needed_threads < max_threads:
+        num_threads = needed_threads
+    else:
+        num_threads = max_threads
+    
+    if tabs > 1:
+        print(f'[*] Using {num_threads} threads with {tabs} tabs each for processing')
+    else:
+        print(f'[*] Using {num_threads} threads for processing')
+    # Workers and the supervisor only read ew.db, all their writes are
+    # committed by the writer thread
+    writer = DBWriter(cli_parsed.d + '/ew.db', m.Queue())
+    writer.start()
+    try:
+        start_time.value = time.time()  # Set start time
+
+        def start_worker():
+            # Every worker has its own queue, so the scheduler knows which
+            # targets a lost worker took with it
+            targets = m.Queue()
+            w = Process(target=worker_thread, args=(
+                cli_parsed, targets, launch_slots, (multi_counter, multi_total),
+                start_time), kwargs={'run_stats': run_stats, 'events': events,
+                                     'writes': writer.queue})
+            w.start()
+            return w, targets
+
+        supervisor = WorkerSupervisor(dbm, WriterClient(writer.queue),
+                                      start_worker, num_threads,
+                                      getattr(cli_parsed, 'max_retries', 1))
+        # Hand out targets (and retries) until every target is final, only
+        # then tell the workers to stop. Each worker gets its tabs' worth
+        # loading plus as many again waiting.
+        dispatch_targets(supervisor, events, multi_counter, multi_total,
+                         pending, hosts, 2 * tabs)
+        supervisor.stop()
+    except Exception as e:
+        print(str(e))
+    finally:
+        writer.stop()
+    print('[*] Wrote {0} DB records in {1} transactions'.format(
+        writer.written, writer.transactions))
+    return multi_total
 
 
 def multi_mode(cli_parsed):
@@ -416,10 +701,8 @@ def multi_mode(cli_parsed):
         dbm.initialize_db()
     dbm.save_options(cli_parsed)
     m = Manager()
-    targets = m.Queue()
-    lock = m.Lock()
-    multi_counter = m.Value('i', 0)
-    start_time = m.Value('d', 0.0)  # Track start time for ETA
+    launch_slots = m.Semaphore(max(1, getattr(cli_parsed, 'max_launches', 4)))
+    run_stats = m.dict()
     display = None
 
     def exitsig(*args):
@@ -435,8 +718,13 @@ def multi_mode(cli_parsed):
     else:
         url_list = target_creator(cli_parsed)
         if cli_parsed.web:
-            for url in url_list:
-                dbm.create_http_object(url, cli_parsed)
+            dbm.create_http_objects(url_list, cli_parsed)
+
+    if cli_parsed.web:
+        # Resolve every host once, then weed out dead targets before any
+        # browser is launched
+        resolve_targets(dbm)
+        run_preflight(cli_parsed, dbm)
 
     if cli_parsed.web:
         # Setup virtual display with cross-platform handling
@@ -454,7 +742,7 @@ def multi_mode(cli_parsed):
         # Get system info and recommended threads
         print(f'[*] {get_system_info()}')
         
-        multi_total = dbm.get_incomplete_http(targets)
+        multi_total = dbm.count_incomplete_http()
         if multi_total > 0:
             if cli_parsed.resume:
                 print('Resuming Web Scan ({0} Hosts Remaining)'.format(str(multi_total)))
@@ -462,35 +750,42 @@ def multi_mode(cli_parsed):
                 print('Starting Web Requests ({0} Hosts)'.format(str(multi_total)))
 
         # Adjust thread count based on workload and resources
-        recommended_threads = resource_monitor.get_recommended_threads(cli_parsed.threads)
+        tabs = getattr(cli_parsed, 'tabs', 1)
+        recommended_threads = resource_monitor.get_recommended_threads(cli_parsed.threads, tabs)
         if recommended_threads < cli_parsed.threads:
             print(f'[*] Adjusting threads from {cli_parsed.threads} to {recommended_threads} based on available memory')
-        
-        if multi_total < recommended_threads:
-            num_threads = multi_total
+
+        fast_timeout = getattr(cli_parsed, 'fast_timeout', None)
+        if fast_timeout is None:
+            run_capture_stage(cli_parsed, dbm, m, launch_slots, run_stats,
+                              recommended_threads)
         else:
-            num_threads = recommended_threads
-        
-        print(f'[*] Using {num_threads} threads for processing')
-        for i in range(num_threads):
-            targets.put(None)
-        try:
-            start_time.value = time.time()  # Set start time
-            workers = [Process(target=worker_thread, args=(
-                cli_parsed, targets, lock, (multi_counter, multi_total), start_time)) for i in range(num_threads)]
-            for w in workers:
-                w.start()
-            for w in workers:
-                w.join()
-        except Exception as e:
-            print(str(e))
+            # Pass one sweeps everything with the short timeout, pass two
+            # gives the hosts that timed out but answered the full timeout
+            print(f'[*] Pass 1: {fast_timeout} second timeout')
+            fast_cli = copy.copy(cli_parsed)
+            fast_cli.timeout = fast_timeout
+            fast_cli.capture_pass = 1
+            run_capture_stage(fast_cli, dbm, m, launch_slots, run_stats,
+                              recommended_threads, capture_pass=1)
+
+            slow_threads = getattr(cli_parsed, 'slow_threads', None) or \
+                max(1, recommended_threads // 4)
+            print(f'[*] Pass 2: {cli_parsed.timeout} second timeout for slow hosts')
+            slow_cli = copy.copy(cli_parsed)
+            slow_cli.capture_pass = 2
+            run_capture_stage(slow_cli, dbm, m, launch_slots, run_stats,
+                              min(slow_threads, recommended_threads), capture_pass=2)
+        print_driver_summary(run_stats)
 
     if display is not None:
         display.stop()
-    results = dbm.get_complete_http()
-    dbm.close()
     m.shutdown()
-    sort_data_and_write(cli_parsed, results)
+    # Deduplicate before rendering so the reports reference canonical
+    # screenshots from the start
+    duplicate_check(cli_parsed, dbm)
+    sort_data_and_write(cli_parsed, dbm)
+    dbm.close()
 
 
 if __name__ == "__main__":
@@ -578,7 +873,6 @@ if __name__ == "__main__":
 
     if cli_parsed.f is not None or cli_parsed.x is not None:
         multi_mode(cli_parsed)
-        duplicate_check(cli_parsed)
 
     print('Finished in {0} seconds'.format(time.time() - start_time))
 
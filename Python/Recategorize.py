@@ -27,9 +27,9 @@ if __name__ == "__main__":
     files = glob.glob(cli_parsed.d + '/report*.html')
     for f in files:
         os.remove(f)
-    results = dbm.recategorize()
+    dbm.recategorize()
     print('Writing report')
-    sort_data_and_write(cli_parsed, results)
+    sort_data_and_write(cli_parsed, dbm)
     newfiles = glob.glob(cli_parsed.d + '/report.html')
     if open_file_input(cli_parsed):
         for f in newfiles:
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Multi-tab capture for EyeWitness
+Drives several targets at once through the tabs of a single Chrome so each
+worker process no longer needs one browser per page in flight
+"""
+
+import queue
+import time
+
+from modules.selenium_module import TimeoutException
+from modules.selenium_module import WebDriverException
+from modules.selenium_module import classify_error
+from modules.selenium_module import document_events
+from modules.selenium_module import driver_crashed
+from modules.selenium_module import driver_stats
+from modules.selenium_module import drain_performance_log
+from modules.selenium_module import finish_capture
+from modules.selenium_module import main_frame_id
+from modules.selenium_module import page_settled
+from modules.selenium_module import probe_readiness
+from modules.selenium_module import ready_limits
+from modules.selenium_module import request_headers
+from modules.selenium_module import restart_driver
+from modules.selenium_module import stop_loading
+
+# Seconds to sleep when a polling round finished nothing
+POLL_INTERVAL = 0.1
+
+
+class _Tab(object):
+
+    """One browser tab and the capture it is working on"""
+
+    def __init__(self, handle, frame_id):
+        self.handle = handle
+        # Performance log events name the tab by its top frame id
+        self.frame_id = frame_id
+        self.http_object = None
+        self.deadline = None
+        self.loaded_at = None
+        self.outcome = None
+
+
+class TabPool(object):
+
+    """Schedule captures onto the free tabs of one Chrome
+
+    The driver must use pageLoadStrategy 'none' (create_driver does this for
+    --tabs above 1) so a navigation returns at once. Each round the pool
+    fills idle tabs, reads the shared performance log once and routes each
+    document outcome to its tab by frame id, then finishes every tab whose
+    page failed, finished loading or ran out of time.
+    """
+
+    def __init__(self, cli_parsed, driver, tabs, ua=None):
+        """
+        Args:
+            cli_parsed (ArgumentParser): Command Line Object
+            driver (WebDriver): Selenium WebDriver to open the tabs in
+            tabs (int): Pages loaded concurrently
+            ua (str, optional): User agent the driver was created with
+        """
+        self.cli_parsed = cli_parsed
+        self.driver = driver
+        self.ua = ua
+        self.tab_count = max(1, tabs)
+        self.timeout = getattr(cli_parsed, 'timeout', 7)
+        self.from_browser = getattr(cli_parsed, 'header_source', 'browser') == 'browser'
+        self.delay, self.ready_cap = ready_limits(cli_parsed)
+        self._tabs = []
+        self._open_tabs()
+
+    def _open_tabs(self):
+        driver = self.driver
+        driver.switch_to.window(driver.window_handles[0])
+        handles = [driver.current_window_handle]
+        while len(handles) < self.tab_count:
+            driver.switch_to.new_window('tab')
+            handles.append(driver.current_window_handle)
+        self._tabs = []
+        for handle in handles:
+            driver.switch_to.window(handle)
+            frame_id = main_frame_id(driver) or handle.replace('CDwindow-', '')
+            self._tabs.append(_Tab(handle, frame_id))
+        if self.from_browser:
+            drain_performance_log(driver)
+
+    def run(self, next_target, on_done):
+        """Capture targets until next_target() returns None
+
+        Args:
+            next_target (callable): Returns the next HTTPTableObject/UAObject,
+                or None once there is no more work. Called with block=False
+                while other tabs are busy, and then raises queue.Empty when
+                nothing is queued yet
+            on_done (callable): Called with every finished object
+
+        Returns:
+            WebDriver: The driver in use at the end (it may have been restarted)
+        """
+        exhausted = False
+        while True:
+            if not exhausted:
+                for tab in self._tabs:
+                    if tab.http_object is not None:
+                        continue
+                    # Only wait for work when no page is loading, the busy
+                    # tabs must keep being polled or they never finish
+                    busy = any(t.http_object is not None for t in self._tabs)
+                    try:
+                        http_object = next_target(block=not busy)
+                    except queue.Empty:
+                        break
+                    if http_object is None:
+                        exhausted = True
+                        break
+                    self._start(tab, http_object, on_done)
+            busy = [tab for tab in self._tabs if tab.http_object is not None]
+            if not busy:
+                break
+            if not self._poll(busy, on_done):
+                time.sleep(POLL_INTERVAL)
+        return self.driver
+
+    def _start(self, tab, http_object, on_done):
+        if not self.from_browser:
+            request_headers(self.cli_parsed, http_object, self.ua)
+        print(f'[*] Taking screenshot of {http_object.remote_system}')
+        tab.http_object = http_object
+        tab.outcome = None
+        tab.loaded_at = None
+        tab.deadline = time.time() + self.timeout
+        try:
+            self.driver.switch_to.window(tab.handle)
+            self.driver.get(http_object.remote_system)
+        except TimeoutException:
+            pass
+        except WebDriverException as e:
+            if driver_crashed(e):
+                self._restart(on_done)
+            else:
+                http_object.error_state = classify_error(e, http_object.remote_system)
+                self._done(tab, on_done)
+
+    def _route_log(self, busy):
+        if not self.from_browser:
+            return
+        try:
+            entries = self.driver.get_log('performance')
+        except WebDriverException as e:
+            if driver_crashed(e):
+                raise
+            return
+        events = document_events(entries)
+        for tab in busy:
+            if tab.outcome is None and tab.frame_id in events:
+                tab.outcome = events[tab.frame_id]
+
+    def _poll(self, busy, on_done):
+        """Finish every tab that is ready, returns how many were finished"""
+        finished = 0
+        try:
+            self._route_log(busy)
+            for tab in busy:
+                if self._check(tab, on_done):
+                    finished += 1
+        except WebDriverException as e:
+            if not driver_crashed(e):
+                raise
+            self._restart(on_done)
+            finished += 1
+        return finished
+
+    def _check(self, tab, on_done):
+        http_object = tab.http_object
+        if tab.outcome is not None and tab.outcome[2]:
+            http_object.error_state = classify_error(
+                tab.outcome[2], http_object.remote_system)
+            self._done(tab, on_done)
+            return True
+
+        driver = self.driver
+        driver.switch_to.window(tab.handle)
+        now = time.time()
+        if tab.loaded_at is None and now > tab.deadline:
+            print(f'[*] Timeout connecting to {http_object.remote_system}')
+            http_object.error_state = 'Timeout'
+            # Keep whatever rendered before the deadline, the tab is reused
+            try:
+                stop_loading(driver)
+                response = None
+                if tab.outcome is not None:
+                    response = tab.outcome[:2]
+                finish_capture(self.cli_parsed, http_object, driver, self.ua,
+                               response, header_fallback=False)
+                driver_stats['recoveries'] += 1
+            except WebDriverException as e:
+                if driver_crashed(e):
+                    raise
+            self._done(tab, on_done)
+            return True
+
+        probe = probe_readiness(driver)
+        if tab.loaded_at is None:
+            location = probe.get('location') or ''
+            if location == 'about:blank' or probe.get('readyState') != 'complete':
+                # Still on the blank page the tab was parked on, or loading
+                return False
+            if location.startswith('chrome-error://'):
+                # Navigation failed without a loadingFailed event to name it
+                http_object.error_state = classify_error(
+                    'navigation failed', http_object.remote_system)
+                self._done(tab, on_done)
+                return True
+            tab.loaded_at = now
+
+        # Loaded; shoot once the page settles or the readiness cap is hit
+        waited = now - tab.loaded_at
+        if waited < self.ready_cap and not (
+                waited >= self.delay and page_settled(probe)):
+            return False
+        try:
+            response = None
+            if tab.outcome is not None:
+                response = tab.outcome[:2]
+            finish_capture(self.cli_parsed, http_object, driver, self.ua, response)
+        except WebDriverException as e:
+            if driver_crashed(e):
+                raise
+            http_object.error_state = classify_error(e, http_object.remote_system)
+        self._done(tab, on_done)
+        return True
+
+    def _done(self, tab, on_done):
+        http_object = tab.http_object
+        tab.http_object = None
+        tab.outcome = None
+        on_done(http_object)
+        try:
+            # Stop the old page from running scripts or navigating while
+            # the tab waits for its next target
+            self.driver.switch_to.window(tab.handle)
+            self.driver.get('about:blank')
+        except WebDriverException as e:
+            if driver_crashed(e):
+                raise
+
+    def _restart(self, on_done):
+        """Replace a crashed browser, failing every capture it had in flight"""
+        print('[*] Chrome driver crashed - restarting')
+        for tab in self._tabs:
+            if tab.http_object is not None:
+                tab.http_object.error_state = 'Driver Crashed'
+                on_done(tab.http_object)
+                tab.http_object = None
+        self.driver = restart_driver(self.cli_parsed, self.driver, self.ua)
+        self._open_tabs()
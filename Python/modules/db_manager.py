@@ -1,9 +1,103 @@
 import pickle
 import sqlite3
+import time
+from collections import namedtuple
 
 from modules.objects import HTTPTableObject
 from modules.objects import UAObject
 from modules.helpers import default_creds_category
+from modules.preflight import DEAD_STATES
+from modules.validation import canonical_key
+
+
+# What the main process needs to schedule a target; workers load the rest
+Target = namedtuple('Target', 'id remote_system resolved')
+
+# Columns shared by the http and ua tables, one per HTTPTableObject field.
+# Page sources live in the source table and headers in the headers table so
+# readers never have to load them unless they ask for them.
+OBJECT_COLUMNS = [
+    ('remote_system', 'text'),
+    ('page_title', 'text'),
+    ('error_state', 'text'),
+    ('category', 'text'),
+    ('default_creds', 'text'),
+    ('resolved', 'text'),
+    ('screenshot_path', 'text'),
+    ('source_path', 'text'),
+    ('root_path', 'text'),
+    ('ssl_error', 'boolean'),
+    ('blank', 'boolean'),
+    ('max_difference', 'integer'),
+    ('source_length', 'integer'),
+    ('status_code', 'integer'),
+    ('retries', 'integer'),
+]
+
+# preflight holds the liveness probe result (see modules/preflight.py),
+# capture_pass the --fast-timeout pass a target belongs to, claimed_by /
+# lease_expiry the worker process capturing it right now (see
+# modules/supervisor.py), canon_key the validation.canonical_key that
+# keeps one row per page, and probe_result why pre-flight skipped the
+# redundant scheme of an http:// / https:// pair
+HTTP_COLUMNS = [('complete', 'boolean')] + OBJECT_COLUMNS + [
+    ('preflight', 'text'),
+    ('capture_pass', 'integer'),
+    ('claimed_by', 'text'),
+    ('lease_expiry', 'real'),
+    ('canon_key', 'text'),
+    ('probe_result', 'text'),
+]
+
+UA_COLUMNS = [
+    ('parent_id', 'integer'),
+    ('complete', 'boolean'),
+    ('key', 'text'),
+    ('browser', 'text'),
+    ('ua', 'text'),
+] + OBJECT_COLUMNS
+
+OBJECT_FIELDS = [name for name, _ in OBJECT_COLUMNS]
+
+
+def _object_values(obj):
+    """Column values for an HTTPTableObject/UAObject, in OBJECT_COLUMNS order
+
+    Reads the private attributes with defaults so objects unpickled from old
+    databases, which may predate some fields, convert cleanly.
+    """
+    source_code = getattr(obj, '_source_code', None)
+    values = []
+    for field in OBJECT_FIELDS:
+        if field == 'source_length':
+            if source_code is not None:
+                values.append(len(source_code))
+            else:
+                values.append(getattr(obj, '_source_length', None))
+        else:
+            values.append(getattr(obj, '_' + field, None))
+    return values
+
+
+def _object_headers(obj):
+    """Header rows for an object as (name, value, raw) tuples
+
+    Raw response headers are stored when present. Otherwise the display-only
+    headers (e.g. a header collection failure notice) are kept instead.
+    """
+    raw_headers = getattr(obj, '_http_headers', None)
+    if raw_headers:
+        return [(name, value, True) for name, value in raw_headers.items()]
+    display_headers = getattr(obj, '_headers', None)
+    if display_headers:
+        return [(name, value, False) for name, value in display_headers.items()]
+    return []
+
+
+def result_record(table, obj):
+    """The write_records() record storing a finished capture"""
+    return ('result', table, obj.id, _object_values(obj), _object_headers(obj),
+            obj.source_code)
 
 
 class DB_Manager(object):
@@ -11,6 +105,10 @@ class DB_Manager(object):
     """docstring for DB_Manager"""
 
     def __init__(self, dbpath):
+        """
+        Args:
+            dbpath (str): Path to ew.db
+        """
         super(DB_Manager, self).__init__()
         self._dbpath = dbpath
         self._connection = None
@@ -29,18 +127,125 @@ class DB_Manager(object):
         sqlite3.register_converter("BOOLEAN", lambda v: bool(int(v)))
         c.execute('''CREATE TABLE opts
              (object blob)''')
-        c.execute('''CREATE TABLE http
-            (id integer primary key, object blob, complete boolean)''')
-        c.execute('''CREATE TABLE ua
-            (id integer primary key, parent_id integer, object blob,
-                complete boolean, key text)''')
+        self._create_tables(c)
         self.connection.commit()
         c.close()
 
+    def _create_tables(self, c):
+        c.execute('CREATE TABLE http (id integer primary key, {0})'.format(
+            ', '.join('{0} {1}'.format(*col) for col in HTTP_COLUMNS)))
+        c.execute('CREATE TABLE ua (id integer primary key, {0})'.format(
+            ', '.join('{0} {1}'.format(*col) for col in UA_COLUMNS)))
+        c.execute('''CREATE TABLE headers
+            (owner text, owner_id integer, name text, value text,
+                raw boolean)''')
+        c.execute('''CREATE TABLE source
+            (owner text, owner_id integer, body blob,
+                PRIMARY KEY (owner, owner_id))''')
+        self._create_aux_tables(c)
+        self._create_indexes(c)
+
+    def _create_aux_tables(self, c):
+        """Tables added after the columnar format, created when missing"""
+        c.execute('''CREATE TABLE IF NOT EXISTS dns
+            (host text PRIMARY KEY, resolved text)''')
+
+    def _create_indexes(self, c):
+        c.execute('CREATE INDEX IF NOT EXISTS http_complete ON http (complete)')
+        c.execute('CREATE INDEX IF NOT EXISTS http_category ON http (category)')
+        c.execute('CREATE INDEX IF NOT EXISTS http_error_state ON http (error_state)')
+        c.execute('CREATE INDEX IF NOT EXISTS headers_owner ON headers (owner, owner_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS ua_parent ON ua (parent_id)')
+        # Rows from databases that predate canon_key are NULL, which never
+        # conflicts
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS http_canon_key ON http (canon_key)')
+
     def open_connection(self):
         self._connection = sqlite3.connect(
             self._dbpath, check_same_thread=False)
         self._connection.row_factory = sqlite3.Row
+        # WAL lets workers write while others read, and NORMAL sync only
+        # fsyncs on checkpoints instead of on every commit
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._upgrade_schema()
+
+    def _table_columns(self, c, table):
+        return [row['name'] for row in c.execute(
+            'PRAGMA table_info({0})'.format(table)).fetchall()]
+
+    def _upgrade_schema(self):
+        """Bring an existing ew.db up to the current schema
+
+        Databases written by older EyeWitness versions store every object as
+        a pickled blob and are migrated in place. Newer databases only get
+        any columns added since they were created.
+        """
+        c = self.connection.cursor()
+        http_columns = self._table_columns(c, 'http')
+        if not http_columns:
+            # Fresh file, initialize_db() creates the tables
+            c.close()
+            return
+        if 'object' in http_columns:
+            self._migrate_pickled_db(c)
+        else:
+            for table, columns in (('http', HTTP_COLUMNS), ('ua', UA_COLUMNS)):
+                existing = self._table_columns(c, table)
+                for name, col_type in columns:
+                    if name not in existing:
+                        c.execute('ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+                            table, name, col_type))
+            self._create_aux_tables(c)
+            self._create_indexes(c)
+        self.connection.commit()
+        c.close()
+
+    def _migrate_pickled_db(self, c):
+        print('[*] Migrating {0} to the columnar database format'.format(self._dbpath))
+        c.execute('ALTER TABLE http RENAME TO http_legacy')
+        c.execute('ALTER TABLE ua RENAME TO ua_legacy')
+        self._create_tables(c)
+        count = 0
+        # Unpickle one row at a time through a second cursor so the legacy
+        # blobs are never all in memory at once
+        legacy = self.connection.cursor()
+        for row in legacy.execute('SELECT * FROM http_legacy'):
+            obj = pickle.loads(row['object'])
+            self._insert_object(c, 'http', row['id'], obj, {
+                'complete': bool(row['complete'])})
+            count += 1
+        for row in legacy.execute('SELECT * FROM ua_legacy'):
+            obj = pickle.loads(row['object'])
+            self._insert_object(c, 'ua', row['id'], obj, {
+                'complete': bool(row['complete']),
+                'parent_id': row['parent_id'],
+                'key': row['key'],
+                'browser': getattr(obj, '_browser', None),
+                'ua': getattr(obj, '_ua', None)})
+        legacy.close()
+        c.execute('DROP TABLE http_legacy')
+        c.execute('DROP TABLE ua_legacy')
+        print('[*] Migrated {0} hosts'.format(count))
+
+    def _insert_object(self, c, table, rowid, obj, extra):
+        columns = ['id'] + list(extra.keys()) + OBJECT_FIELDS
+        values = [rowid] + list(extra.values()) + _object_values(obj)
+        c.execute('INSERT INTO {0} ({1}) VALUES ({2})'.format(
+            table, ','.join(columns), ','.join('?' * len(columns))), values)
+        c.executemany(
+            'INSERT INTO headers (owner, owner_id, name, value, raw) VALUES (?,?,?,?,?)',
+            [(table, rowid) + header for header in _object_headers(obj)])
+        source_code = getattr(obj, '_source_code', None)
+        if source_code is not None:
+            c.execute('INSERT OR REPLACE INTO source (owner, owner_id, body) VALUES (?,?,?)',
+                      (table, rowid, sqlite3.Binary(self._source_bytes(source_code))))
+
+    @staticmethod
+    def _source_bytes(source_code):
+        if isinstance(source_code, str):
+            return source_code.encode('utf-8')
+        return source_code
 
     def create_http_object(self, remote_system, cli_parsed):
         c = self.connection.cursor()
@@ -54,14 +259,63 @@ class DB_Manager(object):
         if rowid is None:
             rowid = 0
         obj.id = rowid + 1
-        pobj = sqlite3.Binary(pickle.dumps(obj, protocol=2))
-        c.execute(("INSERT INTO http (object, complete)"
-                   "VALUES (?,?)"),
-                  (pobj, False))
+        self._insert_object(c, 'http', obj.id, obj, {
+            'complete': False, 'canon_key': canonical_key(obj.remote_system)})
         self.connection.commit()
         c.close()
         return obj
 
+    def create_http_objects(self, remote_systems, cli_parsed):
+        """Bulk insert targets in a single transaction
+
+        Ids are allocated from one MAX(id) lookup and the rows are written
+        with executemany in chunks, so seeding a large target list costs one
+        commit instead of one per URL. Targets whose canonical key is
+        already in the table (the same page reached through another
+        scheme spelling, default port or input) are skipped by the unique
+        canon_key index.
+
+        Args:
+            remote_systems (iterable): URLs to insert
+            cli_parsed (ArgumentParser): Command Line Object
+
+        Returns:
+            int: Number of targets inserted
+        """
+        c = self.connection.cursor()
+        c.execute("SELECT MAX(id) FROM http")
+        rowid = c.fetchone()[0]
+        if rowid is None:
+            rowid = 0
+        insert = 'INSERT OR IGNORE INTO http (id, complete, canon_key, {0}) VALUES ({1})'.format(
+            ','.join(OBJECT_FIELDS), ','.join('?' * (len(OBJECT_FIELDS) + 3)))
+        count = 0
+        seen = 0
+        rows = []
+        for remote_system in remote_systems:
+            obj = HTTPTableObject()
+            obj.remote_system = remote_system
+            obj.set_paths(
+                cli_parsed.d, None)
+            obj.max_difference = cli_parsed.difference
+            rowid += 1
+            rows.append([rowid, False, canonical_key(obj.remote_system)] +
+                        _object_values(obj))
+            if len(rows) >= 1000:
+                c.executemany(insert, rows)
+                count += c.rowcount
+                seen += len(rows)
+                rows = []
+        if rows:
+            c.executemany(insert, rows)
+            count += c.rowcount
+            seen += len(rows)
+        self.connection.commit()
+        c.close()
+        if seen > count:
+            print('[*] Skipped {0} duplicate targets'.format(seen - count))
+        return count
+
     def create_ua_object(self, http_object, browser, ua):
         c = self.connection.cursor()
         obj = UAObject(browser, ua)
@@ -71,30 +325,180 @@ class DB_Manager(object):
         if rowid is None:
             rowid = 0
         obj.id = rowid + 1
-        pobj = sqlite3.Binary(pickle.dumps(obj, protocol=2))
-        c.execute(("INSERT INTO ua (parent_id, object, complete, key)"
-                   " VALUES (?,?,?,?)"),
-                  (http_object.id, pobj, False, browser))
+        self._insert_object(c, 'ua', obj.id, obj, {
+            'parent_id': http_object.id, 'complete': False, 'key': browser,
+            'browser': browser, 'ua': ua})
         self.connection.commit()
         c.close()
         return obj
 
     def update_ua_object(self, ua_object):
+        self.write_records([result_record('ua', ua_object)])
+
+    def update_http_object(self, http_object):
+        self.write_records([result_record('http', http_object)])
+
+    def defer_http_object(self, http_object, capture_pass):
+        """Leave a target incomplete and move it to a later pass"""
         c = self.connection.cursor()
-        o = sqlite3.Binary(pickle.dumps(ua_object, protocol=2))
-        c.execute(("UPDATE ua SET object=?,complete=? WHERE id=?"),
-                  (o, True, ua_object.id))
+        c.execute("UPDATE http SET capture_pass=?, claimed_by=NULL,"
+                  " lease_expiry=NULL WHERE id=?", (capture_pass, http_object.id))
         self.connection.commit()
         c.close()
 
-    def update_http_object(self, http_object):
+    def record_retry(self, http_object):
+        """Store the retry count of a target that stays incomplete for now"""
+        c = self.connection.cursor()
+        c.execute("UPDATE http SET retries=?, claimed_by=NULL, lease_expiry=NULL"
+                  " WHERE id=?", (http_object.retries, http_object.id))
+        self.connection.commit()
+        c.close()
+
+    def write_records(self, records):
+        """Apply a batch of worker results in a single transaction, in order
+
+        Records are the compact tuples workers send to db_writer.DBWriter:
+            ('result', table, id, values, headers, source)
+            ('claim', id, worker, lease_expiry)
+            ('retry', id, retries)
+            ('defer', id, capture_pass)
+            ('fail', id, error_state)
+            ('release', workers)
+        """
+        c = self.connection.cursor()
+        for record in records:
+            op = record[0]
+            if op == 'result':
+                self._write_result(c, *record[1:])
+            elif op == 'claim':
+                c.execute("UPDATE http SET claimed_by=?, lease_expiry=? WHERE id=?"
+                          " AND complete=0", (record[2], record[3], record[1]))
+            elif op == 'retry':
+                c.execute("UPDATE http SET retries=?, claimed_by=NULL,"
+                          " lease_expiry=NULL WHERE id=?", (record[2], record[1]))
+            elif op == 'defer':
+                c.execute("UPDATE http SET capture_pass=?, claimed_by=NULL,"
+                          " lease_expiry=NULL WHERE id=?", (record[2], record[1]))
+            elif op == 'fail':
+                # A result that made it to the DB wins
+                c.execute("UPDATE http SET complete=1, error_state=?, claimed_by=NULL,"
+                          " lease_expiry=NULL WHERE id=? AND complete=0",
+                          (record[2], record[1]))
+            elif op == 'release':
+                self._release_claims(c, record[1])
+        self.connection.commit()
+        c.close()
+
+    def _release_claims(self, c, workers):
+        # Claims of dead workers on targets they never finished, None
+        # releases every claim
+        if workers is None:
+            where, params = "claimed_by IS NOT NULL", ()
+        else:
+            where = "claimed_by IN ({0})".format(','.join('?' * len(workers)))
+            params = tuple(workers)
+        c.execute("UPDATE http SET claimed_by=NULL, lease_expiry=NULL WHERE"
+                  " complete=0 AND " + where, params)
+
+    def _write_result(self, c, table, rowid, values, headers, source):
+        fields = ','.join(f + '=?' for f in OBJECT_FIELDS)
+        if table == 'http':
+            # Finished, so the worker's claim on it ends here
+            fields += ',claimed_by=NULL,lease_expiry=NULL'
+        c.execute('UPDATE {0} SET complete=1, {1} WHERE id=?'.format(table, fields),
+                  values + [rowid])
+        c.execute('DELETE FROM headers WHERE owner=? AND owner_id=?', (table, rowid))
+        c.executemany(
+            'INSERT INTO headers (owner, owner_id, name, value, raw) VALUES (?,?,?,?,?)',
+            [(table, rowid) + header for header in headers])
+        if source is not None:
+            c.execute('INSERT OR REPLACE INTO source (owner, owner_id, body) VALUES (?,?,?)',
+                      (table, rowid, sqlite3.Binary(self._source_bytes(source))))
+
+    def replace_screenshot_paths(self, replacements):
+        """Point rows at canonical screenshots
+
+        Args:
+            replacements (dict): {duplicate screenshot path: canonical path}
+        """
         c = self.connection.cursor()
-        o = sqlite3.Binary(pickle.dumps(http_object, protocol=2))
-        c.execute(("UPDATE http SET object=?,complete=? WHERE id=?"),
-                  (o, True, http_object.id))
+        c.execute('CREATE TEMP TABLE IF NOT EXISTS screenshot_map'
+                  ' (old text PRIMARY KEY, new text)')
+        c.execute('DELETE FROM screenshot_map')
+        c.executemany('INSERT INTO screenshot_map (old, new) VALUES (?,?)',
+                      list(replacements.items()))
+        for table in ('http', 'ua'):
+            c.execute('UPDATE {0} SET screenshot_path=(SELECT new FROM screenshot_map'
+                      ' WHERE old={0}.screenshot_path) WHERE screenshot_path IN'
+                      ' (SELECT old FROM screenshot_map)'.format(table))
+        c.execute('DROP TABLE screenshot_map')
         self.connection.commit()
         c.close()
 
+    def _http_from_row(self, row):
+        obj = HTTPTableObject()
+        obj.id = row['id']
+        obj.preflight = row['preflight']
+        obj.probe_result = row['probe_result']
+        self._fill_object(obj, row)
+        return obj
+
+    def _ua_from_row(self, row):
+        obj = UAObject(row['browser'], row['ua'])
+        obj.id = row['id']
+        obj.parent = row['parent_id']
+        self._fill_object(obj, row)
+        return obj
+
+    def _fill_object(self, obj, row):
+        for field in OBJECT_FIELDS:
+            if field in ('ssl_error', 'blank'):
+                setattr(obj, field, bool(row[field]))
+            elif field == 'remote_system':
+                if row[field] is not None:
+                    obj.remote_system = row[field]
+            else:
+                setattr(obj, field, row[field])
+        if 'body' in row.keys() and row['body'] is not None:
+            obj.source_code = bytes(row['body'])
+
+    def _attach_headers(self, c, owner, objects):
+        """Load header rows for a list of objects with one query per chunk"""
+        by_id = {o.id: o for o in objects}
+        ids = list(by_id.keys())
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = c.execute(
+                'SELECT * FROM headers WHERE owner=? AND owner_id IN ({0})'.format(
+                    ','.join('?' * len(chunk))), [owner] + chunk).fetchall()
+            raw = {}
+            display = {}
+            for row in rows:
+                target = raw if row['raw'] else display
+                target.setdefault(row['owner_id'], {})[row['name']] = row['value']
+            for rowid, headers in raw.items():
+                by_id[rowid].http_headers = headers
+            for rowid, headers in display.items():
+                by_id[rowid].headers = headers
+
+    def load_source(self, obj, owner='http'):
+        """Lazily load the page source of an object read without it
+
+        Args:
+            obj (HTTPTableObject): Object read from this database
+            owner (str): 'http' or 'ua'
+
+        Returns:
+            HTTPTableObject: The same object with source_code set
+        """
+        c = self.connection.cursor()
+        row = c.execute('SELECT body FROM source WHERE owner=? AND owner_id=?',
+                        (owner, obj.id)).fetchone()
+        c.close()
+        if row is not None:
+            obj.source_code = bytes(row['body'])
+        return obj
+
     def save_options(self, cli_parsed):
         opts = sqlite3.Binary(pickle.dumps(cli_parsed, protocol=2))
         c = self.connection.cursor()
@@ -110,42 +514,309 @@ class DB_Manager(object):
         cli_parsed = pickle.loads(blob)
         return cli_parsed
 
-    def get_incomplete_http(self, q):
-        count = 0
+    @staticmethod
+    def _incomplete_where(capture_pass):
+        if capture_pass is None:
+            return "complete=0", ()
+        return "complete=0 AND capture_pass=?", (capture_pass,)
+
+    def claim_first_pass(self):
+        """Assign every incomplete target without a pass to --fast-timeout pass 1"""
         c = self.connection.cursor()
-        for row in c.execute("SELECT * FROM http WHERE complete=0"):
-            o = pickle.loads(row['object'])
-            q.put(o)
-            count += 1
+        c.execute("UPDATE http SET capture_pass=1 WHERE complete=0 AND"
+                  " capture_pass IS NULL")
+        self.connection.commit()
+        c.close()
+
+    def count_incomplete_http(self, capture_pass=None):
+        where, params = self._incomplete_where(capture_pass)
+        c = self.connection.cursor()
+        count = c.execute("SELECT COUNT(*) FROM http WHERE " + where,
+                          params).fetchone()[0]
         c.close()
         return count
 
+    def iter_incomplete_targets(self, capture_pass=None, chunk_size=1000):
+        """Stream incomplete targets in id order
+
+        Each chunk is its own short keyset query, so no read transaction is
+        held open while the workers write and only one chunk of small
+        Target tuples is in memory at a time.
+
+        Args:
+            capture_pass (int, optional): Only targets of this pass
+            chunk_size (int): Rows per query
+
+        Yields:
+            Target: (id, remote_system, resolved)
+        """
+        where, params = self._incomplete_where(capture_pass)
+        query = ("SELECT id, remote_system, resolved FROM http WHERE {0}"
+                 " AND id>? ORDER BY id LIMIT ?".format(where))
+        last = 0
+        while True:
+            c = self.connection.cursor()
+            rows = c.execute(query, params + (last, chunk_size)).fetchall()
+            c.close()
+            if not rows:
+                return
+            for row in rows:
+                yield Target(row['id'], row['remote_system'], row['resolved'])
+            last = rows[-1]['id']
+
+    def get_http_object(self, rowid, incomplete=False):
+        """Load a single http object by id, None if there is no such row
+
+        Args:
+            rowid (int): Target id
+            incomplete (bool): Also return None if the target is complete
+        """
+        query = "SELECT * FROM http WHERE id=?"
+        if incomplete:
+            query += " AND complete=0"
+        c = self.connection.cursor()
+        row = c.execute(query, (rowid,)).fetchone()
+        c.close()
+        if row is None:
+            return None
+        return self._http_from_row(row)
+
+    def get_expired_claims(self, now=None):
+        """(id, claimed_by) of incomplete targets whose lease has run out"""
+        now = time.time() if now is None else now
+        c = self.connection.cursor()
+        rows = c.execute("SELECT id, claimed_by FROM http WHERE complete=0 AND"
+                         " claimed_by IS NOT NULL AND lease_expiry<?",
+                         (now,)).fetchall()
+        c.close()
+        return [(row['id'], row['claimed_by']) for row in rows]
+
+    def get_claims(self, ids):
+        """{id: (claimed_by, retries)} for the incomplete targets among ids"""
+        ids = list(ids)
+        claims = {}
+        c = self.connection.cursor()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for row in c.execute(
+                    "SELECT id, claimed_by, retries FROM http WHERE complete=0 AND"
+                    " id IN ({0})".format(','.join('?' * len(chunk))), chunk):
+                claims[row['id']] = (row['claimed_by'], row['retries'] or 0)
+        c.close()
+        return claims
+
+    def count_unprobed_http(self):
+        """Number of incomplete targets not yet pre-flight checked"""
+        c = self.connection.cursor()
+        count = c.execute("SELECT COUNT(*) FROM http WHERE complete=0 AND"
+                          " preflight IS NULL").fetchone()[0]
+        c.close()
+        return count
+
+    def iter_unprobed_http(self, chunk_size=1000):
+        """Stream incomplete targets not yet pre-flight checked in id order
+
+        Keyset paged like iter_incomplete_targets, so record_preflight can
+        commit between chunks.
+
+        Yields:
+            Target: (id, remote_system, resolved)
+        """
+        query = ("SELECT id, remote_system, resolved FROM http WHERE complete=0"
+                 " AND preflight IS NULL AND id>? ORDER BY id LIMIT ?")
+        last = 0
+        while True:
+            c = self.connection.cursor()
+            rows = c.execute(query, (last, chunk_size)).fetchall()
+            c.close()
+            if not rows:
+                return
+            for row in rows:
+                yield Target(row['id'], row['remote_system'], row['resolved'])
+            last = rows[-1]['id']
+
+    def record_preflight(self, results):
+        """Store pre-flight results, completing targets found dead
+
+        Args:
+            results (list): (id, state) tuples from preflight.probe_response
+        """
+        c = self.connection.cursor()
+        c.executemany("UPDATE http SET preflight=? WHERE id=?",
+                      [(state, rowid) for rowid, state in results])
+        c.executemany("UPDATE http SET complete=1, error_state=? WHERE id=?",
+                      [(state, rowid) for rowid, state in results
+                       if state in DEAD_STATES])
+        self.connection.commit()
+        c.close()
+
+    def record_scheme_skips(self, skips):
+        """Complete the redundant variants of --prepend-https pairs
+
+        Args:
+            skips (list): (id, reason) tuples from preflight.pick_schemes
+        """
+        c = self.connection.cursor()
+        c.executemany("UPDATE http SET complete=1, error_state='Skipped',"
+                      " probe_result=? WHERE id=?",
+                      [(reason, rowid) for rowid, reason in skips])
+        self.connection.commit()
+        c.close()
+
+    def count_unresolved_http(self):
+        """Number of incomplete targets without a resolved host"""
+        c = self.connection.cursor()
+        count = c.execute("SELECT COUNT(*) FROM http WHERE complete=0 AND"
+                          " resolved IS NULL").fetchone()[0]
+        c.close()
+        return count
+
+    def iter_unresolved_http(self, chunk_size=1000):
+        """Stream incomplete targets without a resolved host in id order
+
+        Keyset paged like iter_incomplete_targets, so record_dns can commit
+        between chunks.
+
+        Yields:
+            Target: (id, remote_system, resolved)
+        """
+        query = ("SELECT id, remote_system, resolved FROM http WHERE complete=0"
+                 " AND resolved IS NULL AND id>? ORDER BY id LIMIT ?")
+        last = 0
+        while True:
+            c = self.connection.cursor()
+            rows = c.execute(query, (last, chunk_size)).fetchall()
+            c.close()
+            if not rows:
+                return
+            for row in rows:
+                yield Target(row['id'], row['remote_system'], row['resolved'])
+            last = rows[-1]['id']
+
+    def get_dns_answers(self, hosts):
+        """{host: resolved} for those of hosts looked up before"""
+        hosts = list(hosts)
+        answers = {}
+        c = self.connection.cursor()
+        for start in range(0, len(hosts), 500):
+            chunk = hosts[start:start + 500]
+            for row in c.execute(
+                    "SELECT host, resolved FROM dns WHERE host IN ({0})".format(
+                        ','.join('?' * len(chunk))), chunk):
+                answers[row['host']] = row['resolved']
+        c.close()
+        return answers
+
+    def record_dns(self, answers, assignments):
+        """Store lookup results and the resolved value of each target
+
+        Args:
+            answers (dict): {host: resolved} for newly looked up hosts
+            assignments (list): (resolved, http id) tuples
+        """
+        c = self.connection.cursor()
+        c.executemany("INSERT OR REPLACE INTO dns (host, resolved) VALUES (?,?)",
+                      list(answers.items()))
+        c.executemany("UPDATE http SET resolved=? WHERE id=?", assignments)
+        self.connection.commit()
+        c.close()
+
     def get_incomplete_ua(self, q, key):
         count = 0
         c = self.connection.cursor()
         for row in c.execute("SELECT * FROM ua WHERE complete=? AND key=?",
                              (0, key)):
-            o = pickle.loads(row['object'])
+            o = self._ua_from_row(row)
             q.put(o)
             count += 1
         c.close()
         return count
 
-    def get_complete_http(self):
-        finished = []
+    def _iter_http(self, where='complete=1', params=(), with_source=False,
+                   chunk_size=500, order='http.id'):
+        """Stream fully assembled http objects
+
+        Rows are read in order through a single cursor. For every chunk
+        of rows the matching ua and header rows are fetched with one indexed
+        query each, so the whole read costs a handful of queries per chunk
+        instead of one per host, and only one chunk is held at a time.
+
+        Args:
+            where (str): SQL condition on the http table
+            params (tuple): Parameters for the condition
+            with_source (bool): Also load the page source bodies
+            chunk_size (int): Rows assembled per batch
+            order (str): SQL ORDER BY clause
+
+        Yields:
+            HTTPTableObject: Object with its headers and UA variants attached
+        """
+        if with_source:
+            query = ("SELECT http.*, source.body FROM http LEFT JOIN source"
+                     " ON source.owner='http' AND source.owner_id=http.id")
+        else:
+            query = "SELECT http.* FROM http"
         c = self.connection.cursor()
-        rows = c.execute("SELECT * FROM http WHERE complete=1").fetchall()
-        for row in rows:
-            o = pickle.loads(row['object'])
-            uadat = c.execute("SELECT * FROM ua WHERE parent_id=?",
-                              (o.id,)).fetchall()
-            for ua in uadat:
-                uao = pickle.loads(ua['object'])
-                if uao is not None and uao.source_code is not None and o.source_code:
-                    o.add_ua_data(uao)
-            finished.append(o)
+        rows = c.execute("{0} WHERE {1} ORDER BY {2}".format(query, where, order),
+                         params)
+        aux = self.connection.cursor()
+        while True:
+            chunk = [self._http_from_row(row) for row in rows.fetchmany(chunk_size)]
+            if not chunk:
+                break
+            self._attach_headers(aux, 'http', chunk)
+            self._attach_ua_data(aux, chunk)
+            for o in chunk:
+                yield o
+        aux.close()
         c.close()
-        return finished
+
+    def _attach_ua_data(self, c, objects):
+        """Load UA variants for a chunk of http objects in one query"""
+        by_id = {o.id: o for o in objects}
+        ids = list(by_id.keys())
+        uas = [self._ua_from_row(row) for row in c.execute(
+            'SELECT * FROM ua WHERE parent_id IN ({0}) ORDER BY parent_id, id'.format(
+                ','.join('?' * len(ids))), ids).fetchall()]
+        if not uas:
+            return
+        self._attach_headers(c, 'ua', uas)
+        for uao in uas:
+            o = by_id[uao.parent]
+            if uao.source_length is not None and o.source_length is not None:
+                o.add_ua_data(uao)
+
+    def iter_complete_http(self, with_source=False):
+        """Generator over every completed http object, see _iter_http()"""
+        return self._iter_http('complete=1', with_source=with_source)
+
+    def count_report_sections(self):
+        """Sizes of the report sections
+
+        Returns:
+            tuple: ({category: hosts} of successful captures, error count)
+        """
+        c = self.connection.cursor()
+        counts = dict((row['category'], row['hosts']) for row in c.execute(
+            "SELECT category, COUNT(*) AS hosts FROM http WHERE complete=1"
+            " AND error_state IS NULL GROUP BY category"))
+        errors = c.execute("SELECT COUNT(*) FROM http WHERE complete=1 AND"
+                           " error_state IS NOT NULL").fetchone()[0]
+        c.close()
+        return counts, errors
+
+    def iter_category_http(self, category):
+        """Successful captures of one category in title order, see _iter_http()"""
+        return self._iter_http(
+            'complete=1 AND error_state IS NULL AND category IS ?', (category,),
+            order='http.page_title, http.id')
+
+    def iter_error_http(self):
+        """Failed captures by error and title, see _iter_http()"""
+        # Untitled errors sort as 'None', where the report always put them
+        return self._iter_http('complete=1 AND error_state IS NOT NULL',
+                               order="http.error_state, COALESCE(http.page_title, 'None'),"
+                                     " http.id")
 
     def clear_table(self, tname):
         c = self.connection.cursor()
@@ -160,69 +831,58 @@ class DB_Manager(object):
         return self.connection.cursor()
 
     def recategorize(self):
-        finished = []
+        """Re-run signature/category matching over every completed host
+
+        New categories and credentials are stored, so the report can read
+        each category back from the DB.
+
+        Returns:
+            int: Hosts processed
+        """
         counter = 0
         c = self.connection.cursor()
-        rows = c.execute("SELECT * FROM http WHERE complete=1").fetchall()
-        total = len(rows)
-        for row in rows:
-            o = pickle.loads(row['object'])
-            uadat = c.execute("SELECT * FROM ua WHERE parent_id=?",
-                              (o.id,)).fetchall()
-            for ua in uadat:
-                uao = pickle.loads(ua['object'])
-                if uao is not None:
-                    o.add_ua_data(uao)
+        total = c.execute("SELECT COUNT(*) FROM http WHERE complete=1").fetchone()[0]
+        changes = []
+        for o in self.iter_complete_http(with_source=True):
             if o.category != 'unauth' and o.category != 'notfound':
                 t = o.category
                 o = default_creds_category(o)
                 if o.category != t:
                     print('{0} changed to {1}'.format(t, o.category))
+                changes.append((o.category, o.default_creds, o.id))
             counter += 1
             if counter % 10 == 0:
                 print('{0}/{1}'.format(counter, total))
-            finished.append(o)
+            if len(changes) >= 500:
+                c.executemany("UPDATE http SET category=?, default_creds=? WHERE id=?",
+                              changes)
+                changes = []
+        c.executemany("UPDATE http SET category=?, default_creds=? WHERE id=?",
+                      changes)
+        self.connection.commit()
         c.close()
-        return finished
+        return counter
 
     def search_for_term(self, search):
         finished = []
-        c = self.connection.cursor()
-        rows = c.execute("SELECT * FROM http WHERE complete=1").fetchall()
-        for row in rows:
-            o = pickle.loads(row['object'])
-
-            if type(o.source_code) is str:
-                o.source_code = o.source_code.encode()
-
+        # Match against the stored source bytes and title inside SQLite so
+        # only hits are ever loaded
+        where = ("complete=1 AND error_state IS NULL AND"
+                 " (instr((SELECT body FROM source WHERE owner='http'"
+                 " AND owner_id=http.id), ?) > 0 OR instr(page_title, ?) > 0)")
+        for o in self._iter_http(where, (search.encode(), search)):
             if type(o.page_title) is str:
                 o.page_title = o.page_title.encode()
-
-            uadat = c.execute("SELECT * FROM ua WHERE parent_id=?",
-                              (o.id,)).fetchall()
-            for ua in uadat:
-                uao = pickle.loads(ua['object'])
-                if uao is not None:
-                    o.add_ua_data(uao)
-
-            # if o.source_code or o.page_title are None, set them to empty strings for comparison
-            source_code = b'' if o.source_code is None else o.source_code
-            page_title = b'' if o.page_title is None else o.page_title
-
-            if o.error_state is None:
-                if search.encode() in source_code or search.encode() in page_title:
-                    finished.append(o)
-        c.close()
+            finished.append(o)
         return finished
 
     def get_mikto_results(self):
         results = []
         c = self.connection.cursor()
-        rows = c.execute("SELECT * FROM http WHERE complete=1").fetchall()
+        rows = c.execute(
+            "SELECT * FROM http WHERE complete=1 AND error_state IS NULL"
+            " AND category IN ('notfound', 'crap')").fetchall()
         for row in rows:
-            o = pickle.loads(row['object'])
-            if o.error_state is None and (o.category == 'notfound'
-                                          or o.category == 'crap'):
-                results.append(o)
+            results.append(self._http_from_row(row))
         c.close()
         return results
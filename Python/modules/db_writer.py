@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Single-writer access to ew.db for EyeWitness
+Workers, and the supervisor in the main process, send compact result
+records through a Manager queue to one writer thread, which owns the only
+write connection while workers run and commits whatever has queued up in
+one transaction, so no worker ever waits on SQLite locks
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+
+from modules.db_manager import DB_Manager
+from modules.db_manager import result_record
+
+# Most records committed in one transaction
+MAX_BATCH = 500
+
+# Tries at committing a batch before it is given up on
+WRITE_ATTEMPTS = 5
+
+
+class DBWriter(object):
+
+    """Thread owning the write connection to ew.db
+
+    Records are written in the order they arrive. While a transaction is
+    being committed the next records queue up, so the batches grow with
+    the load and the commit rate stays flat however many workers there are.
+    """
+
+    def __init__(self, dbpath, records):
+        """
+        Args:
+            dbpath (str): Path to ew.db
+            records (Queue): Manager queue the records arrive on. Workers
+                can be killed mid-put, which would leave the lock of a
+                multiprocessing.Queue held and block every other writer.
+        """
+        self.dbpath = dbpath
+        self.queue = records
+        self.written = 0
+        self.transactions = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='DBWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Write everything sent so far, then stop the thread"""
+        self.queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        dbm = DB_Manager(self.dbpath)
+        dbm.open_connection()
+        try:
+            running = True
+            while running:
+                batch = [self.queue.get()]
+                while len(batch) < MAX_BATCH:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    running = False
+                    batch = [record for record in batch if record is not None]
+                if batch:
+                    self._write(dbm, batch)
+        finally:
+            dbm.close()
+
+    def _write(self, dbm, batch):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                dbm.write_records(batch)
+            except sqlite3.Error as e:
+                dbm.connection.rollback()
+                print('[!] DB write failed: {0}'.format(e))
+                time.sleep(1)
+                continue
+            self.written += len(batch)
+            self.transactions += 1
+            return
+        # The rows stay incomplete, so --resume captures them again
+        print('[!] Dropped {0} results after {1} failed writes'.format(
+            len(batch), WRITE_ATTEMPTS))
+
+
+class WriterClient(object):
+
+    """Stand-in for the DB_Manager write methods, for workers and supervisor
+
+    Every call only puts a record on the queue and returns at once.
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records (Queue): DBWriter.queue
+        """
+        self.records = records
+
+    def update_http_object(self, http_object):
+        self.records.put(result_record('http', http_object))
+
+    def update_ua_object(self, ua_object):
+        self.records.put(result_record('ua', ua_object))
+
+    def claim(self, rowid, worker, lease):
+        """Lease a target to a worker for lease seconds (see modules/supervisor.py)"""
+        self.records.put(('claim', rowid, worker, time.time() + lease))
+
+    def record_retry(self, http_object):
+        self.records.put(('retry', http_object.id, http_object.retries))
+
+    def defer_http_object(self, http_object, capture_pass):
+        self.records.put(('defer', http_object.id, capture_pass))
+
+    def set_retries(self, rowid, retries):
+        self.records.put(('retry', rowid, retries))
+
+    def fail_http_object(self, rowid, error_state):
+        """Finalize a target that can not be captured without loading it"""
+        self.records.put(('fail', rowid, error_state))
+
+    def release_claims(self, workers=None):
+        """Drop the claims of dead workers, None releases every claim"""
+        self.records.put(('release', workers))
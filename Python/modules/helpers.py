@@ -1,31 +1,57 @@
 # -*- coding: utf-8 -*- 
+import csv
 import hashlib
 import os
 import platform
-import random
 import shutil
 import sys
-import time
 import xml.sax
 import glob
+import re
 import socket
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from netaddr import IPAddress
 from netaddr.core import AddrFormatError
 from urllib.parse import urlparse
-from modules.validation import validate_url, validate_url_list, get_url_validation_errors
+from urllib.parse import urlsplit
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+from modules.signatures import get_signature_matcher
+from modules.validation import validate_url_list, get_url_validation_errors
+from modules.validation import find_invalid_urls
+
+# Bytes of -x input handed to the XML parser at a time
+XML_CHUNK_SIZE = 1 << 20
+
+# Lines of -f input validated together (one process pool task)
+VALIDATION_CHUNK_SIZE = 10000
 
 
 class XML_Parser(xml.sax.ContentHandler):
 
-    def __init__(self, file_out, class_cli_obj):
+    """SAX handler collecting web URLs from nmap, masscan and Nessus XML
+
+    Found URLs are deduplicated against a set and buffered until drain(),
+    so a file fed to the parser piece by piece is never held in memory.
+    """
+
+    def __init__(self, class_cli_obj):
         self.system_name = None
         self.port_number = None
         self.protocol = None
         self.masscan = False
         self.nmap = False
         self.nessus = False
-        self.url_list = []
+        # Every URL found so far, only used to drop duplicates; found_urls
+        # holds the new ones until drain() hands them out
+        self.seen_urls = set()
+        self.found_urls = []
         self.port_open = False
         self.http_ports = ['80', '8080']
         self.https_ports = ['443', '8443']
@@ -33,7 +59,6 @@ class XML_Parser(xml.sax.ContentHandler):
         self.get_fqdn = False
         self.get_ip = False
         self.service_detection = False
-        self.out_file = file_out
         self.analyze_plugin_output = False
         self.read_plugin_output = False
         self.plugin_output = ""
@@ -113,37 +138,25 @@ class XML_Parser(xml.sax.ContentHandler):
                     if (self.system_name is not None) and (self.port_number is not None) and self.port_open:
                         if self.protocol == "http" or self.protocol == "https":
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                         elif self.protocol is None and self.port_number in self.http_ports:
                             built_url = "http://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                         elif self.protocol is None and self.port_number in self.https_ports:
                             built_url = "https://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
 
                 else:
                     if (self.system_name is not None) and (self.port_number is not None) and self.port_open and int(self.port_number) in self.only_ports:
                         if self.protocol == "http" or self.protocol == "https":
                             built_url = self.protocol + "://" + self.system_name
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                         elif self.protocol is None and self.port_number in self.http_ports:
                             built_url = "http://" + self.system_name
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                         elif self.protocol is None and self.port_number in self.https_ports:
                             built_url = "https://" + self.system_name
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
 
                 self.port_number = None
                 self.protocol = None
@@ -155,29 +168,21 @@ class XML_Parser(xml.sax.ContentHandler):
                         if self.port_number in self.http_ports:
                             self.protocol = 'http'
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                         elif self.port_number in self.https_ports:
                             self.protocol = 'https'
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                 else:
                     if (self.port_number is not None) and self.port_open and (self.system_name is not None) and int(self.port_number) in self.only_ports:
                         if self.port_number in self.http_ports:
                             self.protocol = 'http'
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                         elif self.port_number in self.https_ports:
                             self.protocol = 'https'
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
-                                self.num_urls += 1
+                            self._add_url(built_url)
                 self.port_number = None
                 self.protocol = None
                 self.port_open = False
@@ -185,12 +190,6 @@ class XML_Parser(xml.sax.ContentHandler):
             elif tag == "host":
                 self.system_name = None
 
-            elif tag == "nmaprun":
-                if len(self.url_list) > 0:
-                    with open(self.out_file, 'a') as temp_web:
-                        for url in self.url_list:
-                            temp_web.write(url + '\n')
-
         elif self.nessus:
             if tag == "plugin_output" and self.read_plugin_output:
 
@@ -208,15 +207,13 @@ class XML_Parser(xml.sax.ContentHandler):
                     if (self.system_name is not None) and (self.protocol is not None) and self.service_detection:
                         if self.protocol == "http" or self.protocol == "https":
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
+                            self._add_url(built_url)
 
                 else:
                     if (self.system_name is not None) and (self.protocol is not None) and self.service_detection and int(self.port_number) in self.only_ports:
                         if self.protocol == "http" or self.protocol == "https":
                             built_url = self.protocol + "://" + self.system_name + ":" + self.port_number
-                            if built_url not in self.url_list:
-                                self.url_list.append(built_url)
+                            self._add_url(built_url)
 
                 self.port_number = None
                 self.protocol = None
@@ -226,147 +223,304 @@ class XML_Parser(xml.sax.ContentHandler):
             elif tag == "ReportHost":
                 self.system_name = None
 
-            elif tag == "NessusClientData_v2":
-                if len(self.url_list) > 0:
-                    with open(self.out_file, 'a') as temp_web:
-                        for url in self.url_list:
-                            temp_web.write(url + '\n')
-
     def characters(self, content):
         if self.read_plugin_output:
             self.plugin_output += content
 
-def duplicate_check(cli_object):
+    def _add_url(self, built_url):
+        if built_url not in self.seen_urls:
+            self.seen_urls.add(built_url)
+            self.found_urls.append(built_url)
+            self.num_urls += 1
+
+    def drain(self):
+        """Return the URLs found since the last call"""
+        found, self.found_urls = self.found_urls, []
+        return found
+
+def hash_screenshot(path, perceptual=False):
+    """Hash a screenshot for duplicate detection
+
+    Args:
+        path (str): PNG file
+        perceptual (bool): Use a difference hash of a downscaled grayscale
+            copy so near-identical renders (e.g. the same default page with a
+            different clock) hash the same. Needs Pillow.
+
+    Returns:
+        str: Hex digest
+    """
+    if perceptual and HAS_PIL:
+        try:
+            with Image.open(path) as image:
+                small = image.convert('L').resize((9, 8))
+            pixels = list(small.getdata())
+            bits = 0
+            for row in range(8):
+                for col in range(8):
+                    left = pixels[row * 9 + col]
+                    right = pixels[row * 9 + col + 1]
+                    bits = (bits << 1) | (1 if left > right else 0)
+            return 'p{0:016x}'.format(bits)
+        except (IOError, OSError):
+            pass
+    digest = hashlib.md5()
+    with open(path, 'rb') as screenshot:
+        for chunk in iter(lambda: screenshot.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def duplicate_check(cli_object, dbm=None):
     # This is used for checking for duplicate images
     # if it finds any, it removes them and uses a single image
     # reducing file size for output
-    # dict = {sha1hash: [pic1, pic2]}
-    hash_files = {}
-    report_files = []
+    #
+    # Screenshots are hashed in a thread pool and the full
+    # {duplicate: original} map is built before anything is touched. With a
+    # DB_Manager the canonical paths are stored in ew.db so reports rendered
+    # afterwards reference them directly; without one, each existing report
+    # page and Requests.csv is rewritten once.
+    perceptual = getattr(cli_object, 'perceptual_dedup', False)
+    if perceptual and not HAS_PIL:
+        print('[*] Pillow not found, falling back to exact duplicate detection')
+        print('[*] Try: pip install Pillow')
+        perceptual = False
 
     # Use pathlib for cross-platform path handling
     output_dir = Path(cli_object.d)
     screens_pattern = str(output_dir / 'screens' / '*.png')
-    
-    for name in glob.glob(screens_pattern):
-        with open(name, 'rb') as screenshot:
-            pic_data = screenshot.read()
-        md5_hash = hashlib.md5(pic_data).hexdigest()
-        
-        # Get relative path from output directory for storage
-        name_path = Path(name)
-        relative_path = name_path.relative_to(output_dir)
-        relative_path_str = str(relative_path).replace('\\', '/')  # Normalize for HTML
-        
-        if md5_hash in hash_files:
-            hash_files[md5_hash].append(relative_path_str)
-        else:
-            hash_files[md5_hash] = [relative_path_str]
-
-    # Find HTML report files
-    html_pattern = str(output_dir / '*.html')
-    for html_file in glob.glob(html_pattern):
-        report_files.append(html_file)
-
-    # Process duplicates
-    for hex_value, file_dict in hash_files.items():
-        total_files = len(file_dict)
-        if total_files > 1:
-            original_pic_name = file_dict[0]
-            for num in range(1, total_files):
-                next_filename = file_dict[num]
-                
-                # Update HTML report files
-                for report_page in report_files:
-                    with open(report_page, 'r') as report:
-                        page_text = report.read()
-                    page_text = page_text.replace(next_filename, original_pic_name)
-                    with open(report_page, 'w') as report_out:
-                        report_out.write(page_text)
-                
-                # remove the duplicate 
-                duplicate_file_path = output_dir / next_filename.replace('/', os.sep)
-                if duplicate_file_path.exists():
-                    os.remove(duplicate_file_path)  # should probably use pathlib but this works
-                
-                # Update CSV file
-                csv_file_path = output_dir / "Requests.csv"
-                if csv_file_path.exists():
-                    with open(csv_file_path, 'r') as csv_port_file:
-                        csv_lines = csv_port_file.read()
-                        if next_filename in csv_lines:
-                            csv_lines = csv_lines.replace(next_filename, original_pic_name)
-                    with open(csv_file_path, 'w') as csv_port_writer:
-                        csv_port_writer.write(csv_lines)
-    return
-
+    names = sorted(glob.glob(screens_pattern))
 
-def resolve_host(system):
+    # dict = {hash: [pic1, pic2]}
+    hash_files = {}
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = pool.map(lambda n: hash_screenshot(n, perceptual), names)
+        for name, file_hash in zip(names, hashes):
+            hash_files.setdefault(file_hash, []).append(name)
+
+    replacements = {}
+    for file_list in hash_files.values():
+        for duplicate in file_list[1:]:
+            replacements[duplicate] = file_list[0]
+    if not replacements:
+        return replacements
+
+    if dbm is not None:
+        dbm.replace_screenshot_paths(replacements)
+    else:
+        # Get relative path from output directory, as used in the reports
+        def relative(name):
+            return str(Path(name).relative_to(output_dir)).replace('\\', '/')  # Normalize for HTML
+        relative_map = dict((relative(k), relative(v)) for k, v in replacements.items())
+        pattern = re.compile('|'.join(re.escape(k) for k in
+                                      sorted(relative_map, key=len, reverse=True)))
+        report_files = glob.glob(str(output_dir / '*.html'))
+        csv_file_path = output_dir / "Requests.csv"
+        if csv_file_path.exists():
+            report_files.append(str(csv_file_path))
+        for report_page in report_files:
+            with open(report_page, 'r', encoding='utf-8') as report:
+                page_text = report.read()
+            new_text = pattern.sub(lambda m: relative_map[m.group(0)], page_text)
+            if new_text != page_text:
+                with open(report_page, 'w', encoding='utf-8') as report_out:
+                    report_out.write(new_text)
+
+    # remove the duplicates
+    for duplicate in replacements:
+        if os.path.exists(duplicate):
+            os.remove(duplicate)
+    print('[*] Removed {0} duplicate screenshots'.format(len(replacements)))
+    return replacements
+
+
+def target_host(system):
+    """Host part of a target URL, without any port"""
     parsed = urlparse(system)
-    system = parsed.path if parsed.netloc == '' else parsed.netloc
+    if parsed.netloc == '':
+        return parsed.path
+    return parsed.hostname or parsed.netloc
+
+
+def lookup_host(host):
+    """Reverse lookup for IP addresses, forward lookup for names"""
     try:
-        toresolve = IPAddress(system)
+        toresolve = IPAddress(host)
         resolved = socket.gethostbyaddr(str(toresolve))[0]
         return resolved
     except AddrFormatError:
         pass
-    except socket.herror:
+    except (socket.herror, socket.gaierror):
         return 'Unknown'
 
     try:
-        resolved = socket.gethostbyname(system)
+        resolved = socket.gethostbyname(host)
         return resolved
-    except socket.gaierror:
+    except (socket.gaierror, UnicodeError):
         return 'Unknown'
 
 
-def find_file_name():
-    file_not_found = True
-    file_name = "parsed_xml"
-    counter = 0
-    first_time = True
-    while file_not_found:
-        if first_time:
-            if not os.path.isfile(file_name + ".txt"):
-                file_not_found = False
-            else:
-                counter += 1
-                first_time = False
+def resolve_host(system):
+    return lookup_host(target_host(system))
+
+
+def expand_target(line, cli_obj):
+    """URLs to capture for one input target
+
+    Adds the scheme(s) and --only-ports ports a bare host or URL needs.
+
+    Args:
+        line (str): Stripped target line
+        cli_obj (ArgumentParser): Command Line Object
+
+    Returns:
+        list: URLs for the target
+    """
+    urls = []
+
+    # Account for odd case schemes and fix to lowercase for matching
+    scheme = line.partition(':')[0].lower()
+    if scheme == 'http':
+        line = scheme + '://' + line[7:]
+    elif scheme == 'https':
+        line = scheme + '://' + line[8:]
+
+    if not cli_obj.only_ports:
+        if scheme == 'http' or scheme == 'https':
+            urls.append(line)
         else:
-            if not os.path.isfile(file_name + str(counter) + ".txt"):
-                file_not_found = False
-            else:
-                counter += 1
-    if first_time:
-        return file_name + ".txt"
+            if cli_obj.web:
+                if cli_obj.prepend_https:
+                    urls.append("http://" + line)
+                    urls.append("https://" + line)
+                else:
+                    urls.append(line)
     else:
-        return file_name + str(counter) + ".txt"
+        if scheme == 'http' or scheme == 'https':
+            for port in cli_obj.only_ports:
+                urls.append(line + ':' + str(port))
+        else:
+
+            if cli_obj.web:
+                if cli_obj.prepend_https:
+                    for port in cli_obj.only_ports:
+                        urls.append("http://" + line + ':' + str(port))
+                        urls.append("https://" + line + ':' + str(port))
+                else:
+                    for port in cli_obj.only_ports:
+                        urls.append(line + ':' + str(port))
+    return urls
+
+
+class OpenPorts(object):
+
+    """Index of every host and the ports it has open, for open_ports.csv
+
+    Each target is reduced to its host and port (the scheme's default when
+    none is given) once, as it is added, so the grid is built with exact
+    lookups and written out one row per host.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.ports = set()
+
+    def add(self, url):
+        if ' ' in url:
+            print("ERROR: You potentially provided an mal-formed URL!")
+            print("ERROR: URL is - " + url)
+            sys.exit()
+        parsed = urlsplit(url if '://' in url else 'http://' + url)
+        try:
+            port_number = parsed.port
+        except ValueError:
+            print("ERROR: You potentially provided an mal-formed URL!")
+            print("ERROR: URL is - " + url)
+            sys.exit()
+        if port_number is None:
+            port_number = 443 if parsed.scheme.lower() == 'https' else 80
+        self.hosts.setdefault(parsed.hostname or url, set()).add(port_number)
+        self.ports.add(port_number)
+
+    def write(self, path):
+        ordered_ports = sorted(self.ports)
+        with open(path, 'w', newline='') as csv_file_out:
+            writer = csv.writer(csv_file_out)
+            writer.writerow(['Host'] + ordered_ports)
+            for host, ports in self.hosts.items():
+                writer.writerow([host] + ['X' if port in ports else ''
+                                          for port in ordered_ports])
 
 
 def textfile_parser(file_to_parse, cli_obj):
-    urls = []
-    openports = {}
-    complete_urls = []
+    """Stream the targets in a text file, one per line
+
+    A single pass over the file: each line is validated (unless
+    --skip-validation), expanded to the URLs to capture and indexed for
+    open_ports.csv, and its URLs are yielded straight away. With
+    --validation-processes the checks run in chunks on a process pool
+    alongside the rest. Invalid lines are only reported, as before.
+
+    Args:
+        file_to_parse (str): Path to the target list
+        cli_obj (ArgumentParser): Command Line Object
+
+    Yields:
+        str: URLs to capture
+    """
+    validate = not getattr(cli_obj, 'skip_validation', False)
+    processes = getattr(cli_obj, 'validation_processes', 0) or 0
     validation_errors = []
+    valid_count = 0
+    open_ports = OpenPorts()
+    pool = None
+    pending = deque()
+
+    def check(chunk):
+        if pool is None:
+            return find_invalid_urls(chunk, require_scheme=False)
+        pending.append(pool.submit(find_invalid_urls, chunk, require_scheme=False))
+        # Bound the chunks in flight so memory stays flat
+        if len(pending) <= processes * 2:
+            return []
+        return pending.popleft().result()
+
+    def record(invalid_urls):
+        for url, error in invalid_urls:
+            # Bare hosts get a scheme later, so these two are expected
+            if error != "Invalid scheme" and error != "No host specified in URL":
+                validation_errors.append(f"  - {url}: {error}")
 
     try:
-        # Open the URL file and read all URLs, and reading again to catch
-        # total number of websites
-        with open(file_to_parse) as f:
-            all_urls = [url for url in f if url.strip()]
-
-        # Validate URLs if validation is enabled
-        if hasattr(cli_obj, 'skip_validation') and not cli_obj.skip_validation:
+        if validate:
             print("[*] Validating URLs...")
-            valid_count = 0
-            for url in all_urls:
-                url = url.strip()
-                is_valid, error, normalized = validate_url(url, require_scheme=False)
-                if not is_valid and error != "Invalid scheme" and error != "No host specified in URL":
-                    validation_errors.append(f"  - {url}: {error}")
-                else:
-                    valid_count += 1
-            
+            if processes > 0:
+                pool = ProcessPoolExecutor(max_workers=processes)
+        chunk = []
+        total = 0
+        with open(file_to_parse) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                total += 1
+                if validate:
+                    chunk.append(line)
+                    if len(chunk) >= VALIDATION_CHUNK_SIZE:
+                        record(check(chunk))
+                        chunk = []
+                open_ports.add(line)
+                for url in expand_target(line, cli_obj):
+                    yield url
+
+        if validate:
+            if chunk:
+                record(check(chunk))
+            while pending:
+                record(pending.popleft().result())
+            valid_count = total - len(validation_errors)
             if validation_errors:
                 print(f"[!] Found {len(validation_errors)} invalid URLs:")
                 for error in validation_errors[:10]:  # Show first 10 errors
@@ -375,100 +529,7 @@ def textfile_parser(file_to_parse, cli_obj):
                     print(f"  ... and {len(validation_errors) - 10} more")
                 print(f"[*] Proceeding with {valid_count} valid URLs")
 
-        # else:
-        for line in all_urls:
-            line = line.strip()
-
-            # Account for odd case schemes and fix to lowercase for matching
-            scheme = urlparse(line)[0]
-            if scheme == 'http':
-                line = scheme + '://' + line[7:]
-            elif scheme == 'https':
-                line = scheme + '://' + line[8:]
-
-            if not cli_obj.only_ports:
-                if scheme == 'http' or scheme == 'https':
-                    urls.append(line)
-                else:
-                    if cli_obj.web:
-                        if cli_obj.prepend_https:
-                            urls.append("http://" + line)
-                            urls.append("https://" + line)
-                        else:
-                            urls.append(line)
-            else:
-                if scheme == 'http' or scheme == 'https':
-                    for port in cli_obj.only_ports:
-                        urls.append(line + ':' + str(port))
-                else:
-
-                    if cli_obj.web:
-                        if cli_obj.prepend_https:
-                            for port in cli_obj.only_ports:
-                                urls.append("http://" + line + ':' + str(port))
-                                urls.append("https://" + line + ':' + str(port))
-                        else:
-                            for port in cli_obj.only_ports:
-                                urls.append(line + ':' + str(port))
-        
-        # Look at URLs and make CSV output of open ports unless already parsed from XML output
-        # This parses the text file
-        for url_again in all_urls:
-            url_again = url_again.strip()
-            complete_urls.append(url_again)
-            if url_again.count(":") == 2:
-                char = url_again.split(":")[2].split("/")[0]
-                check = char.isdigit()
-                if check == True:                   
-                    try:
-                        port_number = int(url_again.split(":")[2].split("/")[0])
-                    except ValueError:
-                        print("ERROR: You potentially provided an mal-formed URL!")
-                        print("ERROR: URL is - " + url_again)
-                        sys.exit()
-                    hostname_again = url_again.split(":")[0] + ":" + url_again.split(":")[1] + ":" + url_again.split(":")[2]
-                    if port_number in openports:
-                        openports[port_number] += "," + hostname_again
-                    else:
-                        openports[port_number] = hostname_again
-            else:
-                if "https://" in url_again:
-                    if 443 in openports:
-                        openports[443] += "," + url_again
-                    else:
-                        openports[443] = url_again
-                else:
-                    if 80 in openports:
-                        openports[80] += "," + url_again
-                    else:
-                        openports[80] = url_again
-            if ' ' in url_again.strip():
-                    print("ERROR: You potentially provided an mal-formed URL!")
-                    print("ERROR: URL is - " + url_again)
-                    sys.exit()
-
-        # Start prepping to write out the CSV
-        csv_data = "URL"
-        ordered_ports = sorted(openports.keys())
-        for opn_prt in ordered_ports:
-            csv_data += "," + str(opn_prt)
-
-        # Create the CSV data row by row
-        for ind_system in complete_urls:
-            # add new line and add hostname
-            csv_data += '\n'
-            csv_data += ind_system + ","
-            for test_for_port in ordered_ports:
-                if ind_system in openports[test_for_port]:
-                    csv_data += "X,"
-                else:
-                    csv_data += ","
-
-        # Write out CSV
-        with open(cli_obj.d + "/open_ports.csv", 'w') as csv_file_out:
-            csv_file_out.write(csv_data)
-
-        return urls
+        open_ports.write(cli_obj.d + "/open_ports.csv")
 
     except IOError:
         if cli_obj.x is not None:
@@ -476,6 +537,49 @@ def textfile_parser(file_to_parse, cli_obj):
         else:
             print("ERROR: You didn't give me a valid file name! I need a valid file containing URLs!")
         sys.exit()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def xml_targets(cli_obj):
+    """Stream the web URLs in an nmap, masscan or Nessus XML file
+
+    The file is fed to an incremental SAX parser XML_CHUNK_SIZE bytes at a
+    time and each URL is yielded as soon as its element closes, so memory
+    stays flat however large the export is. Only the unique URLs are kept,
+    for deduplication, and each is indexed for open_ports.csv as it is read.
+
+    Args:
+        cli_obj (ArgumentParser): Command Line Object
+
+    Yields:
+        str: URLs to capture
+    """
+    parser = xml.sax.make_parser()
+    # Turn off namespaces
+    parser.setFeature(xml.sax.handler.feature_namespaces, 0)
+    handler = XML_Parser(cli_obj)
+    parser.setContentHandler(handler)
+    open_ports = OpenPorts()
+
+    with open(cli_obj.x, 'rb') as xml_file:
+        while True:
+            chunk = xml_file.read(XML_CHUNK_SIZE)
+            if not chunk:
+                parser.close()
+            for url in handler.drain():
+                open_ports.add(url)
+                for target in expand_target(url, cli_obj):
+                    yield target
+            if not chunk:
+                break
+            parser.feed(chunk)
+
+    if not handler.seen_urls:
+        print("ERROR: The XML file you provided does not have any active web servers!")
+        sys.exit()
+    open_ports.write(cli_obj.d + "/open_ports.csv")
 
 
 def target_creator(command_line_object):
@@ -485,39 +589,23 @@ def target_creator(command_line_object):
         command_line_object (ArgumentParser): Command Line Arguments
 
     Returns:
-        List: URLs detected for http
+        Iterable: URLs detected for http, streamed as they are parsed for
+            XML input
     """
 
     if command_line_object.x is not None:
 
-        # Get a file name for the parsed results
-        parsed_file_name = find_file_name()
-
-        # Create parser
-        parser = xml.sax.make_parser()
-
-        # Turn off namespaces
-        parser.setFeature(xml.sax.handler.feature_namespaces, 0)
-        # Override the parser
-        Handler = XML_Parser(parsed_file_name, command_line_object)
-        parser.setContentHandler(Handler)
-        # Parse the XML
-
         # Check if path exists
         if os.path.exists(command_line_object.x):
             # Check if it is a file
-            if os.path.isfile(command_line_object.x):
-                parser.parse(command_line_object.x)
-            else:
+            if not os.path.isfile(command_line_object.x):
                 print("ERROR: The path you provided does not point to a file!")
                 sys.exit()
         else:
             print("ERROR: The path you provided does not exist!")
             sys.exit()
 
-        out_urls = textfile_parser(
-            parsed_file_name, command_line_object)
-        return out_urls
+        return xml_targets(command_line_object)
 
     elif command_line_object.f is not None:
 
@@ -567,43 +655,6 @@ def strip_nonalphanum(string):
     return ''.join(c for c in string if c.isalnum())
 
 
-def do_jitter(cli_parsed):
-    """Jitters between URLs to add delay/randomness
-
-    Args:
-        cli_parsed (ArgumentParser): CLI Object
-
-    Returns:
-        TYPE: Description
-    """
-    if cli_parsed.jitter != 0:
-        sleep_value = random.randint(0, 30)
-        sleep_value = sleep_value * .01
-        sleep_value = 1 - sleep_value
-        sleep_value = sleep_value * cli_parsed.jitter
-        print("[*] Sleeping for " + str(sleep_value) + " seconds..")
-        try:
-            time.sleep(sleep_value)
-        except KeyboardInterrupt:
-            pass
-
-def do_delay(cli_parsed):
-    """Delay between the opening of the navigator and taking the screenshot
-
-    Args:
-        cli_parsed (ArgumentParser): CLI Object
-
-    Returns:
-        TYPE: Description
-    """
-    if cli_parsed.delay != 0:
-        sleep_value = cli_parsed.delay
-        print("[*] Sleeping for " + str(sleep_value) + " seconds before taking the screenshot")
-        try:
-            time.sleep(sleep_value)
-        except KeyboardInterrupt:
-            pass
-
 def create_folders_css(cli_parsed):
     # create output dirs and copy css/js files
 
@@ -640,60 +691,23 @@ def default_creds_category(http_object):
     http_object.default_creds = None
     http_object.category = None
     try:
-        # Use pathlib for cross-platform path handling
-        module_dir = Path(__file__).parent
-        sigpath = module_dir.parent / 'signatures.txt'
-        catpath = module_dir.parent / 'categories.txt'
-        with open(sigpath) as sig_file:
-            signatures = sig_file.readlines()
-
-        with open(catpath) as cat_file:
-            categories = cat_file.readlines()
+        matcher = get_signature_matcher()
 
         # Loop through and see if there are any matches from the source code
-        # EyeWitness obtained
+        # EyeWitness obtained. The matcher scans the page once for the
+        # fragments of every signature and category
         if http_object.source_code is not None:
-            for sig in signatures:
-                # Find the signature(s), split them into their own list if needed
-                # Assign default creds to its own variable
-                sig_cred = sig.split('|')
-                page_sig = sig_cred[0].split(";")
-                cred_info = sig_cred[1].strip()
-
-                # Set our variable to 1 if the signature was not identified.  If it is
-                # identified, it will be added later on.  Find total number of
-                # "signatures" needed to uniquely identify the web app
-                # signature_range = len(page_sig)
-
-                # This is used if there is more than one "part" of the
-                # web page needed to make a signature Delimete the "signature"
-                # by ";" before the "|", and then have the creds after the "|"
-                if all([x.lower() in http_object.source_code.decode().lower() for x in page_sig]):
-                    if http_object.default_creds is None:
-                        http_object.default_creds = cred_info
-                    else:
-                        http_object.default_creds += '\n' + cred_info
-                        print('[+] Signature Match: ' + http_object.remote_system + ' - ' + cred_info)
-
-            for cat in categories:
-                # Find the signature(s), split them into their own list if needed
-                # Assign default creds to its own variable
-                cat_split = cat.split('|')
-                cat_sig = cat_split[0].split(";")
-                cat_name = cat_split[1]
-
-                # Set our variable to 1 if the signature was not identified.  If it is
-                # identified, it will be added later on.  Find total number of
-                # "signatures" needed to uniquely identify the web app
-                # signature_range = len(page_sig)
-
-                # This is used if there is more than one "part" of the
-                # web page needed to make a signature Delimete the "signature"
-                # by ";" before the "|", and then have the creds after the "|"
-                if all([x.lower() in http_object.source_code.decode().lower() for x in cat_sig]):
-                    http_object.category = cat_name.strip()
-                    print('[+] Category Match: ' + http_object.remote_system + ' - ' + http_object.category )
-                    break
+            creds, category = matcher.match(http_object.source_code)
+            for cred_info in creds:
+                if http_object.default_creds is None:
+                    http_object.default_creds = cred_info
+                else:
+                    http_object.default_creds += '\n' + cred_info
+                    print('[+] Signature Match: ' + http_object.remote_system + ' - ' + cred_info)
+
+            if category is not None:
+                http_object.category = category
+                print('[+] Category Match: ' + http_object.remote_system + ' - ' + http_object.category )
 
         if http_object.page_title is not None:
             if (type(http_object.page_title)) == bytes:
@@ -23,6 +23,7 @@ class HTTPTableObject(object):
         self._blank = False
         self._uadata = []
         self._source_code = None
+        self._source_length = None
         self._max_difference = None
         self._root_path = None
         self._default_creds = None
@@ -30,6 +31,10 @@ class HTTPTableObject(object):
         self._ssl_error = False
         self._ua_left = None
         self._resolved = None
+        self._status_code = None
+        self._retries = 0
+        self._preflight = None
+        self._probe_result = None
 
     def set_paths(self, outdir, suffix=None):
         file_name = self.remote_system.replace('://', '.')
@@ -106,6 +111,10 @@ class HTTPTableObject(object):
 
     @remote_system.setter
     def remote_system(self, remote_system):
+        scheme, sep, rest = remote_system.partition('://')
+        if sep and scheme.lower() in ('http', 'https'):
+            # HTTP://host is the same target as http://host
+            remote_system = scheme.lower() + sep + rest
         if remote_system.startswith('http://') or remote_system.startswith('https://'):
             pass
         else:
@@ -185,6 +194,49 @@ class HTTPTableObject(object):
     def source_code(self, source_code):
         self._source_code = source_code
 
+    @property
+    def source_length(self):
+        """Length of the page source, available even when the body was not loaded"""
+        if self._source_code is not None:
+            return len(self._source_code)
+        return self._source_length
+
+    @source_length.setter
+    def source_length(self, source_length):
+        self._source_length = source_length
+
+    @property
+    def status_code(self):
+        return self._status_code
+
+    @status_code.setter
+    def status_code(self, status_code):
+        self._status_code = status_code
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @retries.setter
+    def retries(self, retries):
+        self._retries = retries
+
+    @property
+    def preflight(self):
+        return self._preflight
+
+    @preflight.setter
+    def preflight(self, preflight):
+        self._preflight = preflight
+
+    @property
+    def probe_result(self):
+        return self._probe_result
+
+    @probe_result.setter
+    def probe_result(self, probe_result):
+        self._probe_result = probe_result
+
     @property
     def max_difference(self):
         return self._max_difference
@@ -255,6 +307,9 @@ class HTTPTableObject(object):
                     self.sanitize(self.default_creds))
 
         if self.error_state is None:
+            if getattr(self, '_status_code', None) is not None:
+                html += "\n<br><b> Status Code: </b>{0}\n".format(
+                    self._status_code)
             try:
                 html += "\n<br><b> Page Title: </b>{0}\n".format(
                     self.sanitize(self.page_title))
@@ -300,6 +355,9 @@ class HTTPTableObject(object):
             html += ("""</td><td>Connection Refused</td></tr>""")
         elif self.error_state == 'SSLHandshake':
             html += ("""</td><td>SSL Handshake Error</td></tr>""")
+        elif self.error_state == 'Skipped':
+            html += ("""</td><td>Not captured: {0}</td></tr>""").format(
+                self.sanitize(str(self.probe_result)))
         else:
             html += ("""<br><br><a href=\"{0}\"
                 target=\"_blank\">Source Code</a></div></td>
@@ -333,7 +391,7 @@ class HTTPTableObject(object):
         return html.escape(incoming_html.decode(), quote=True)
 
     def add_ua_data(self, uaobject):
-        difference = abs(len(self.source_code) - len(uaobject.source_code))
+        difference = abs(self.source_length - uaobject.source_length)
         if difference > self.max_difference:
             uaobject.difference = difference
             self._uadata.append(uaobject)
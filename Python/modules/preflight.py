@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Pre-flight liveness checks for EyeWitness
+Probes every target with a plain socket before any browser is started so
+dead endpoints never tie up a Chrome worker for the full page timeout
+"""
+
+import socket
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urljoin
+from urllib.parse import urlparse
+
+from netaddr import INET_PTON
+from netaddr import valid_ipv4
+
+# Probe results that mean the browser would only fail. These match the
+# error_state strings set by selenium_module.capture_host.
+DEAD_STATES = ('Connection Refused', 'Connection Reset', 'DNS Failed', 'Timeout')
+
+# Most bytes of a probe reply read looking for the end of the headers
+MAX_REPLY = 8192
+
+# Targets handed to the probe threads at once (at least ten per thread), so
+# a million-line scan never holds a future for every target
+PREFLIGHT_CHUNK = 1000
+
+
+def _ssl_context():
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def probe_target(url, timeout, context=None, address=None):
+    """Check whether a URL has anything listening behind it
+
+    Args:
+        url (str): Target URL
+        timeout (float): Seconds allowed for each network step
+        context (SSLContext, optional): Shared context for https targets
+        address (str, optional): Cached address of the host (see
+            resolver.resolve_targets)
+
+    Returns:
+        str: 'http' if an HTTP response came back, 'open' if something
+            accepted the connection but did not answer in HTTP, otherwise
+            one of DEAD_STATES
+    """
+    return probe_response(url, timeout, context, address)[0]
+
+
+def probe_response(url, timeout, context=None, address=None):
+    """Probe a URL and read back the status line and redirect, if any
+
+    Connects to the host and port, completes a TLS handshake for https and
+    sends a minimal HTTP request, reading no more than the reply headers.
+    With a cached address the host name is only used for SNI and the Host
+    header, so it is not looked up a second time.
+
+    Args:
+        url (str): Target URL
+        timeout (float): Seconds allowed for each network step
+        context (SSLContext, optional): Shared context for https targets
+        address (str, optional): Cached address of the host (see
+            resolver.resolve_targets)
+
+    Returns:
+        tuple: (state, status, location). state is as for probe_target;
+            status (int) and location (str, absolute) are None unless the
+            reply had them
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname
+    if not host:
+        return 'open', None, None
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    except ValueError:
+        return 'open', None, None
+
+    if not address or not valid_ipv4(address, INET_PTON):
+        # Uncached, or 'Unknown'/a reverse name for an IP target
+        address = host
+    try:
+        sock = socket.create_connection((address, port), timeout=timeout)
+    except socket.gaierror:
+        return 'DNS Failed', None, None
+    except ConnectionRefusedError:
+        return 'Connection Refused', None, None
+    except ConnectionResetError:
+        return 'Connection Reset', None, None
+    except socket.timeout:
+        return 'Timeout', None, None
+    except OSError:
+        # Unreachable networks and the like, let the browser report it
+        return 'open', None, None
+
+    try:
+        if parsed.scheme == 'https':
+            try:
+                sock = (context or _ssl_context()).wrap_socket(
+                    sock, server_hostname=host)
+            except ConnectionResetError:
+                return 'Connection Reset', None, None
+            except (ssl.SSLError, OSError):
+                # Chrome may still negotiate something we can't, keep it
+                return 'open', None, None
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        request = 'HEAD {0} HTTP/1.0\r\nHost: {1}\r\nConnection: close\r\n\r\n'.format(
+            path, parsed.netloc)
+        reply = b''
+        try:
+            sock.sendall(request.encode('latin-1', 'replace'))
+            while b'\r\n\r\n' not in reply and len(reply) < MAX_REPLY:
+                data = sock.recv(1024)
+                if not data:
+                    break
+                reply += data
+        except ConnectionResetError:
+            if not reply:
+                return 'Connection Reset', None, None
+        except OSError:
+            if not reply:
+                return 'open', None, None
+        if not reply.startswith(b'HTTP/'):
+            return 'open', None, None
+        return ('http',) + _parse_reply(url, reply)
+    finally:
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+def _parse_reply(url, reply):
+    """(status, absolute Location) from the start of an HTTP reply"""
+    lines = reply.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+    status = None
+    parts = lines[0].split(None, 2)
+    if len(parts) > 1 and parts[1].isdigit():
+        status = int(parts[1])
+    location = None
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'location' and value.strip():
+            location = urljoin(url, value.strip())
+            break
+    return status, location
+
+
+def _pair_keys(url):
+    """Keys under which the http:// and https:// variants of a target meet
+
+    Variants on the same explicit port meet on (host, path, port), the bare
+    http://host / https://host pair --prepend-https makes meets on
+    (host, path, None).
+    """
+    parsed = urlparse(url)
+    try:
+        port = parsed.port
+    except ValueError:
+        return []
+    path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+    host = (parsed.hostname or '').lower()
+    keys = [(host, path, port or (443 if parsed.scheme == 'https' else 80))]
+    if port is None:
+        keys.append((host, path, None))
+    return keys
+
+
+def scheme_to_skip(http_probe, https_probe):
+    """Decide whether one variant of an http:// / https:// pair is redundant
+
+    Args:
+        http_probe (tuple): (url, state, status, location) of the http variant
+        https_probe (tuple): The same for the https variant
+
+    Returns:
+        tuple: ('http' or 'https', reason) for the variant not worth a
+            capture, None when both are
+    """
+    http_url, http_state, http_status, http_location = http_probe
+    https_url, https_state, https_status, https_location = https_probe
+    if http_state in DEAD_STATES or https_state in DEAD_STATES:
+        # The dead one is already completed by the pre-flight check
+        return None
+
+    def redirects_to(location, scheme, url):
+        if not location:
+            return False
+        target = urlparse(location)
+        return target.scheme == scheme and \
+            target.hostname == urlparse(url).hostname
+
+    if http_status in (301, 302, 303, 307, 308) and \
+            redirects_to(http_location, 'https', http_url):
+        return 'http', 'Redirects to {0}'.format(http_location)
+    if https_status in (301, 302, 303, 307, 308) and \
+            redirects_to(https_location, 'http', https_url):
+        return 'https', 'Redirects to {0}'.format(https_location)
+
+    if urlparse(http_url).port is not None or urlparse(https_url).port is not None:
+        # Both variants on one port, which speaks either TLS or plain HTTP
+        if https_state == 'http' and (http_state != 'http' or http_status == 400):
+            return 'http', 'Port speaks TLS, captured over https'
+        if http_state == 'http' and https_state != 'http':
+            return 'https', 'No TLS on this port, captured over http'
+    return None
+
+
+def pick_schemes(probes):
+    """Find the redundant variants among probed --prepend-https pairs
+
+    Args:
+        probes (dict): {id: (url, state, status, location)}
+
+    Returns:
+        list: (id, reason) for every target to skip
+    """
+    pairs = {}
+    for rowid, probe in probes.items():
+        scheme = urlparse(probe[0]).scheme
+        for key in _pair_keys(probe[0]):
+            pairs.setdefault(key, {}).setdefault(scheme, rowid)
+
+    skipped = {}
+    for pair in pairs.values():
+        if 'http' not in pair or 'https' not in pair:
+            continue
+        if pair['http'] in skipped or pair['https'] in skipped:
+            # Never drop both variants of a target
+            continue
+        decision = scheme_to_skip(probes[pair['http']], probes[pair['https']])
+        if decision is not None:
+            skipped[pair[decision[0]]] = decision[1]
+    return list(skipped.items())
+
+
+def run_preflight(cli_parsed, dbm):
+    """Probe every incomplete target and mark dead ones complete in the DB
+
+    Args:
+        cli_parsed (ArgumentParser): Command Line Object
+        dbm (DB_Manager): Open database for the scan
+
+    Returns:
+        int: Number of targets marked dead
+    """
+    if getattr(cli_parsed, 'no_preflight', False):
+        return 0
+    if getattr(cli_parsed, 'proxy_ip', None):
+        # Targets may only be reachable through the proxy
+        print('[*] Skipping pre-flight checks because a proxy is configured')
+        return 0
+
+    total = dbm.count_unprobed_http()
+    if not total:
+        return 0
+
+    threads = max(1, getattr(cli_parsed, 'preflight_threads', 100))
+    timeout = getattr(cli_parsed, 'timeout', 7)
+    context = _ssl_context()
+    chunk_size = max(PREFLIGHT_CHUNK, threads * 10)
+    print('[*] Pre-flight checking {0} targets ({1} threads)'.format(
+        total, threads))
+    start = time.time()
+
+    # --prepend-https captures both schemes of every bare host; keep the
+    # probe details so the redundant one of each pair can be skipped
+    pick = getattr(cli_parsed, 'prepend_https', False)
+    probes = {}
+
+    def probe(target):
+        return probe_response(target.remote_system, timeout, context,
+                              target.resolved)
+
+    dead = 0
+    targets = dbm.iter_unprobed_http(chunk_size)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            chunk = list(islice(targets, chunk_size))
+            if not chunk:
+                break
+            results = []
+            for target, reply in zip(chunk, pool.map(probe, chunk)):
+                state = reply[0]
+                if pick:
+                    probes[target.id] = (target.remote_system,) + reply
+                if state in DEAD_STATES:
+                    print('[*] Pre-flight: {0} - {1}'.format(
+                        target.remote_system, state))
+                    dead += 1
+                results.append((target.id, state))
+            dbm.record_preflight(results)
+
+    print('[*] Pre-flight: {0} live, {1} dead ({2:.1f} seconds)'.format(
+        total - dead, dead, time.time() - start))
+
+    if probes:
+        skips = pick_schemes(probes)
+        if skips:
+            dbm.record_scheme_skips(skips)
+            print('[*] Pre-flight: skipping {0} redundant http/https variants'.format(
+                len(skips)))
+    return dead
@@ -1,9 +1,11 @@
+import csv
 import os
 import sys
 import urllib.parse
 
 try:
     from rapidfuzz import fuzz
+    from rapidfuzz import process
 except ImportError:
     print('[*] rapidfuzz not found.')
     print('[*] Run pip list to verify installation!')
@@ -11,68 +13,244 @@ except ImportError:
     sys.exit()
 
 
-def process_group(
-        data, group, toc, toc_table, page_num, section,
-        sectionid, html):
-    """Retreives a group from the full data, and creates toc stuff
+def process_group(data):
+    """Orders the elements of one category so similar titles are adjacent
+
+    Elements are taken in title order; each remaining element becomes a seed
+    and pulls in every remaining element whose title scores >= 70 against it
+    (token_sort_ratio). Titles with the same sorted tokens always score the
+    same against any other title, so they are scored once as a single key,
+    and each seed key is scored against all remaining keys in one batched
+    rapidfuzz call instead of pairwise Python loops.
 
     Args:
-        data (List): Full set of data containing all hosts
-        group (String): String representing group to process
-        toc (String): HTML for Table of Contents
-        toc_table (String): HTML for Table in ToC
-        page_num (int): Page number we're on in the report
-        section (String): Display name of the group
-        sectionid (String): Unique ID for ToC navigation
-        html (String): HTML for current page of report
+        data (List): Elements of the category
 
     Returns:
         List: Elements for category sorted and grouped
-        String: HTML representing ToC
-        String: HTML representing ToC Table
-        String: HTML representing current report page
     """
-    group_data = sorted([x for x in data if x.category == group], key=lambda k: str(k.page_title))
+    group_data = sorted(data, key=lambda k: str(k.page_title))
 
     grouped_elements = []
     if len(group_data) == 0:
-        return grouped_elements, toc, toc_table, html
-    if page_num == 0:
-        toc += ("<li><a href=\"report.html#{0}\">{1} (Page 1)</a></li>").format(
-            sectionid, section)
-    else:
-        toc += ("<li><a href=\"report_page{0}.html#{1}\">{2} (Page {0})</a></li>").format(
-            str(page_num+1), sectionid, section)
+        return grouped_elements
 
-    html += "<h2 id=\"{0}\">{1}</h2>".format(sectionid, section)
     unknowns = [x for x in group_data if x.page_title == 'Unknown']
     group_data = [x for x in group_data if x.page_title != 'Unknown']
-    while len(group_data) > 0:
-        test_element = group_data.pop(0)
-        temp = [x for x in group_data if fuzz.token_sort_ratio(
-            test_element.page_title, x.page_title) >= 70]
-        temp.append(test_element)
-        temp = sorted(temp, key=lambda k: k.page_title)
+
+    # Bucket elements by normalized title, keeping first-seen (title) order
+    buckets = {}
+    key_text = {}
+    for index, element in enumerate(group_data):
+        title = element.page_title
+        if isinstance(title, str):
+            text = ' '.join(sorted(title.split()))
+        else:
+            text = title
+        if fuzz.token_sort_ratio(text, text) < 70:
+            # Titles that do not even match themselves (e.g. None) never
+            # group with anything, so each element stays on its own
+            key = ('single', index)
+        else:
+            key = ('title', text)
+        if key not in buckets:
+            buckets[key] = []
+            key_text[key] = text
+        buckets[key].append((index, element))
+
+    remaining = dict((key, key_text[key]) for key in buckets
+                     if key[0] == 'title')
+    for key in list(buckets.keys()):
+        members = buckets[key]
+        if not members:
+            continue
+        # The first element is the seed, it goes last before the stable
+        # title sort just like the elements it matched
+        seed = members[0]
+        temp = members[1:]
+        buckets[key] = []
+        if key[0] == 'title':
+            del remaining[key]
+            for _, _, match in process.extract(
+                    key_text[key], remaining, scorer=fuzz.token_sort_ratio,
+                    score_cutoff=70, limit=None):
+                temp.extend(buckets[match])
+                buckets[match] = []
+                del remaining[match]
+        temp.sort(key=lambda k: k[0])
+        temp.append(seed)
+        temp = sorted([element for _, element in temp], key=lambda k: k.page_title)
         grouped_elements.extend(temp)
-        group_data = [x for x in group_data if fuzz.token_sort_ratio(
-            test_element.page_title, x.page_title) < 70]
 
     grouped_elements.extend(unknowns)
-    toc_table += ("<tr><td>{0}</td><td>{1}</td>").format(section,
-                                                         str(len(grouped_elements)))
-    return grouped_elements, toc, toc_table, html
+    return grouped_elements
+
+
+class ReportPager(object):
+
+    """Writes paginated report pages to disk as they fill up
+
+    The number of pages is known before the first page is written, so each
+    page is written with its complete navigation and closed as soon as it
+    holds cli_parsed.results entries. At most one page of HTML is in memory.
+    """
 
+    def __init__(self, out_dir, prefix, head, total_entries, per_page, toc=''):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.head = head
+        self.per_page = max(1, per_page)
+        self.num_pages = max(1, -(-total_entries // self.per_page))
+        self.toc = toc
+        self.table_head = create_table_head()
+        self._file = None
+        self._page = 0
+        self._on_page = 0
+        self._table_open = False
+
+    def page_name(self, page):
+        """File name of a 1-based page number"""
+        if page == 1:
+            return '{0}.html'.format(self.prefix)
+        return '{0}_page{1}.html'.format(self.prefix, page)
+
+    def _navigation(self):
+        if self.num_pages == 1:
+            return '', ''
+        links = "\n<center><br>"
+        for i in range(1, self.num_pages + 1):
+            links += ("<a href=\"{0}\"> Page {1}</a>").format(self.page_name(i), i)
+        links += "</center>\n"
+
+        headfoot = "<h3>Page {0}</h3>".format(self._page)
+        headfoot += "<center>"
+        if self._page > 1:
+            headfoot += ("<a href=\"{0}\" id=\"previous\">Previous Page</a>").format(
+                self.page_name(self._page - 1))
+        if 1 < self._page < self.num_pages:
+            headfoot += "&nbsp"
+        if self._page < self.num_pages:
+            headfoot += ("<a href=\"{0}\" id=\"next\"> Next Page</a>").format(
+                self.page_name(self._page + 1))
+        headfoot += "</center>"
+        return headfoot, links
+
+    def _open_page(self):
+        self._page += 1
+        self._on_page = 0
+        self._file = open(os.path.join(self.out_dir, self.page_name(self._page)),
+                          'w', encoding='utf-8')
+        if self._page == 1:
+            self._file.write(self.toc)
+        self._file.write(self.head)
+        headfoot, links = self._navigation()
+        self._file.write(headfoot + links)
+
+    def _close_page(self):
+        if self._table_open:
+            self._file.write("</table><br>")
+            self._table_open = False
+        headfoot, links = self._navigation()
+        if self.num_pages == 1:
+            self._file.write("</body>\n</html>")
+        else:
+            self._file.write(links + '<br>' + headfoot + '</body></html>')
+        self._file.close()
+        self._file = None
+
+    def start_section(self, title, sectionid=None):
+        """Start a titled table, on the page the next entry lands on"""
+        if self._file is None or self._on_page >= self.per_page:
+            if self._file is not None:
+                self._close_page()
+            self._open_page()
+        if self._table_open:
+            self._file.write("</table><br>")
+        if sectionid is None:
+            self._file.write('<h2>{0}</h2>'.format(title))
+        else:
+            self._file.write("<h2 id=\"{0}\">{1}</h2>".format(sectionid, title))
+        self._file.write(self.table_head)
+        self._table_open = True
+
+    def add(self, html):
+        """Add one entry's table rows"""
+        if self._file is None or self._on_page >= self.per_page:
+            if self._file is not None:
+                self._close_page()
+            self._open_page()
+        if not self._table_open:
+            self._file.write(self.table_head)
+            self._table_open = True
+        self._file.write(html)
+        self._on_page += 1
+
+    def close(self):
+        if self._file is not None:
+            self._close_page()
+
+
+def write_requests_csv(cli_parsed, data):
+    """Writes Requests.csv one row at a time while passing the data through
 
+    Args:
+        cli_parsed (ArgumentParser): CLI Options
+        data (iterable): HTTP objects
 
-def sort_data_and_write(cli_parsed, data):
+    Yields:
+        HTTPTableObject: Every object from data, after its row is written
+    """
+    with open(os.path.join(cli_parsed.d, 'Requests.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Protocol', 'Port', 'Domain', 'URL', 'Resolved',
+                         'Request Status', 'Title', 'Category', 'Default Creds',
+                         'Screenshot Path', 'Source Path'])
+        for json_request in data:
+            url = urllib.parse.urlparse(json_request.remote_system)
+
+            if url.port is not None:
+                port = url.port
+            elif url.scheme == 'https':
+                port = 443
+            else:
+                port = 80
+
+            if url.hostname is None:
+                print("Error when accessing a target's hostname (it's not existent)")
+                print("Possible bad url (improperly formatted) in the URL list.")
+                print("Fix your list and re-try. Killing EyeWitness....")
+                sys.exit(1)
+
+            if json_request.error_state is None:
+                status = "Successful"
+            else:
+                status = json_request.error_state
+                if json_request.probe_result:
+                    status += ' ({0})'.format(json_request.probe_result)
+
+            title = json_request.page_title
+            if isinstance(title, bytes):
+                title = title.decode('utf-8', 'replace')
+
+            writer.writerow([url.scheme, port, url.hostname,
+                             json_request.remote_system, json_request.resolved,
+                             status, str(title), str(json_request.category),
+                             str(json_request.default_creds),
+                             json_request.screenshot_path, json_request.source_path])
+            yield json_request
+
+
+def sort_data_and_write(cli_parsed, dbm):
     """Writes out reports for HTTP objects
 
+    Requests.csv is streamed from the database in one pass. The report is
+    then written one category at a time, each read back in title order, so
+    only the category being grouped is ever in memory.
+
     Args:
         cli_parsed (TYPE): CLI Options
-        data (TYPE): Full set of data
+        dbm (DB_Manager): Open database of the scan
     """
-    # We'll be using this number for our table of contents
-    total_results = len(data)
     categories = [('highval', 'High Value Targets', 'highval'),
                   ('virtualization', 'Virtualization','virtualization'),
                   ('kvm','Remote Console/KVM','kvm'),
@@ -105,205 +283,55 @@ def sort_data_and_write(cli_parsed, data):
                   ('badgw', 'Bad Gateway', 'badgw'),
                   ('serviceunavailable', 'Service Unavailable', 'serviceunavailable'),
                   ]
+
+    total_results = 0
+    for _ in write_requests_csv(cli_parsed, dbm.iter_complete_http()):
+        total_results += 1
     if total_results == 0:
         return
-    # Initialize stuff we need
-    pages = []
+
+    # Grouping reorders a category but never changes its size, so the
+    # section sizes and page numbers are known before anything is loaded
+    counts, error_count = dbm.count_report_sections()
+    sections = [cat for cat in categories if counts.get(cat[0])]
+
+    # Page numbers are deterministic, so the ToC can be written on page 1
+    per_page = max(1, cli_parsed.results)
     toc = create_report_toc_head(cli_parsed.date, cli_parsed.time)
     toc_table = "<table class=\"table\">"
-    web_index_head = create_web_index_head(cli_parsed.date, cli_parsed.time)
-    table_head = create_table_head()
-    counter = 1
-    csv_request_data = "Protocol,Port,Domain,URL,Resolved,Request Status,Title,Category,Default Creds,Screenshot Path, Source Path"
-
-    # Generate and write json log of requests
-    for json_request in data:
-        url = urllib.parse.urlparse(json_request._remote_system)
-
-        # CSV - PROTOCOL
-        csv_request_data += "\n" + url.scheme + ","
-        
-        # CSV - PORT
-        if url.port is not None:
-            csv_request_data += str(url.port) + ","
-        elif url.scheme == 'http':
-            csv_request_data += "80,"
-        elif url.scheme == 'https':
-            csv_request_data += "443,"
-        
-        # CSV - DOMAIN
-        try:
-            csv_request_data += url.hostname + ","
-        except TypeError:
-            print("Error when accessing a target's hostname (it's not existent)")
-            print("Possible bad url (improperly formatted) in the URL list.")
-            print("Fix your list and re-try. Killing EyeWitness....")
-            sys.exit(1)
-        
-        # CSV - URL
-        csv_request_data += json_request._remote_system + ","
-        
-        # CSV - RESOLVED
-        csv_request_data += json_request.resolved + ","
-
-        # CSV - REQUEST STATUS
-        if json_request._error_state == None:
-            csv_request_data += "Successful,"
+    position = 0
+    for cat in sections:
+        page_num = position // per_page + 1
+        if page_num == 1:
+            toc += ("<li><a href=\"report.html#{0}\">{1} (Page 1)</a></li>").format(
+                cat[2], cat[1])
         else:
-            csv_request_data += json_request._error_state + ","
-        
-        # CSV - TITLE
-        try:
-            # get attribute safely
-            title = getattr(json_request, "_page_title", None)
-            if title is None:
-                title_text = "None"
-            else:
-                # ensure string, replace double-quotes so CSV remains valid
-                title_text = str(title).replace('"', '""')
-            csv_request_data += '"' + title_text + '",'
-        except (UnicodeDecodeError, UnicodeEncodeError, AttributeError, TypeError) as e:
-            # fallback for any encoding/None/attribute/concatenation issues
-            csv_request_data += '"!Error",'
-        
-        # CSV - CATEGORY
-        csv_request_data += str(json_request._category) + ","
-        # CSV - DEFAULT CREDS/Signature
-        csv_request_data += "\"" + str(json_request._default_creds) + "\","
-        # CSV - SCREENSHOT PATH 
-        csv_request_data += json_request._screenshot_path + ","
-        # CSV - Source Path
-        csv_request_data += json_request._source_path
-
-    with open(os.path.join(cli_parsed.d, 'Requests.csv'), 'a') as f:
-        f.write(csv_request_data)
-
-    # Pre-filter error entries
-    def key_lambda(k):
-        if k.error_state is None:
-            k.error_state = str(k.error_state)
-        if k.page_title is None:
-            k.page_title = str(k.page_title)
-        return (k.error_state, k.page_title)
-    errors = sorted([x for x in data if (x is not None) and (x.error_state is not None)],
-                     key=key_lambda)
-    data[:] = [x for x in data if x.error_state is None]
-    data = sorted(data, key=lambda k: str(k.page_title))
-    html = u""
-    # Loop over our categories and populate HTML
-    for cat in categories:
-        grouped, toc, toc_table, html = process_group(
-            data, cat[0], toc, toc_table, len(pages), cat[1], cat[2], html)
-        if len(grouped) > 0:
-            html += table_head
-        pcount = 0
-        for obj in grouped:
-            pcount += 1
-            html += obj.create_table_html()
-            if (counter % cli_parsed.results == 0) or (counter == (total_results) -1):
-                html = (web_index_head + "EW_REPLACEME" + html +
-                        "</table><br>")
-                pages.append(html)
-                html = u""
-                if pcount < len(grouped):
-                    html += table_head
-            counter += 1
-        if len(grouped) > 0 and counter - 1 % cli_parsed.results != 0:
-            html += "</table><br>"
-
-    # Add our errors here (at the very very end)
-    if len(errors) > 0:
-        html += '<h2>Errors</h2>'
-        html += table_head
-        for obj in errors:
-            html += obj.create_table_html()
-            if (counter % cli_parsed.results == 0) or (counter == (total_results)):
-                html = (web_index_head + "EW_REPLACEME" + html +
-                        "</table><br>")
-                pages.append(html)
-                html = u"" + table_head
-            counter += 1
-
-    # Close out any stuff thats hanging
+            toc += ("<li><a href=\"report_page{0}.html#{1}\">{2} (Page {0})</a></li>").format(
+                str(page_num), cat[2], cat[1])
+        toc_table += ("<tr><td>{0}</td><td>{1}</td></tr>").format(cat[1],
+                                                              str(counts[cat[0]]))
+        position += counts[cat[0]]
     toc += "</ul>"
     toc_table += "<tr><td>Errors</td><td>{0}</td></tr>".format(
-        str(len(errors)))
+        str(error_count))
     toc_table += "<tr><th>Total</th><td>{0}</td></tr>".format(total_results)
     toc_table += "</table>"
-
-    if (html != u"") and (counter - total_results != 0):
-        html = (web_index_head + "EW_REPLACEME" + html +
-                "</table><br>")
-        pages.append(html)
-
     toc = "<center>{0}<br><br>{1}<br><br></center>".format(toc, toc_table)
 
-    if len(pages) == 1:
-        with open(os.path.join(cli_parsed.d, 'report.html'), 'a', encoding='utf-8') as f:
-            f.write(toc)
-            f.write(pages[0].replace('EW_REPLACEME', ''))
-            f.write("</body>\n</html>")
-    else:
-        num_pages = len(pages) + 1
-        bottom_text = "\n<center><br>"
-        bottom_text += ("<a href=\"report.html\"> Page 1</a>")
-        skip_last_dummy = False
-        # Generate our header/footer data here
-        for i in range(2, num_pages):
-            badd_page = "</center>EW_REPLACEME<table border=\"1\">\n        <tr>\n        <th>Web Request Info</th>\n        <th>Web Screenshot</th>\n        </tr></table><br>"
-            if badd_page in pages[i-1]:
-                skip_last_dummy = True
-                pass
-            else:
-                bottom_text += ("<a href=\"report_page{0}.html\"> Page {0}</a>").format(str(i))
-        bottom_text += "</center>\n"
-        top_text = bottom_text
-        # Generate our next/previous page buttons
-        if skip_last_dummy:
-            amount = len(pages) - 1
-        else:
-            amount = len(pages)
-        for i in range(0, amount):
-            headfoot = "<h3>Page {0}</h3>".format(str(i+1))
-            headfoot += "<center>"
-            if i == 0:
-                headfoot += ("<a href=\"report_page2.html\" id=\"next\"> Next Page "
-                             "</a></center>")
-            elif i == amount - 1:
-                if i == 1:
-                    headfoot += ("<a href=\"report.html\" id=\"previous\"> Previous Page "
-                                 "</a></center>")
-                else:
-                    headfoot += ("<a href=\"report_page{0}.html\" id=\"previous\"> Previous Page "
-                                 "</a></center>").format(str(i))
-            elif i == 1:
-                headfoot += ("<a href=\"report.html\" id=\"previous\">Previous Page</a>&nbsp"
-                             "<a href=\"report_page{0}.html\" id=\"next\"> Next Page"
-                             "</a></center>").format(str(i+2))
-            else:
-                headfoot += ("<a href=\"report_page{0}.html\" id=\"previous\">Previous Page</a>"
-                             "&nbsp<a href=\"report_page{1}.html\" id=\"next\"> Next Page"
-                             "</a></center>").format(str(i), str(i+2))
-            # Finalize our pages by replacing placeholder stuff and writing out
-            # the headers/footers
-            pages[i] = pages[i].replace(
-                'EW_REPLACEME', headfoot + top_text) + bottom_text + '<br>' + headfoot + '</body></html>'
+    pager = ReportPager(cli_parsed.d, 'report',
+                        create_web_index_head(cli_parsed.date, cli_parsed.time),
+                        position + error_count, per_page, toc)
+    for cat in sections:
+        pager.start_section(cat[1], cat[2])
+        for obj in process_group(list(dbm.iter_category_http(cat[0]))):
+            pager.add(obj.create_table_html())
 
-        # Write out our report to disk!
-        if len(pages) == 0:
-            return
-        with open(os.path.join(cli_parsed.d, 'report.html'), 'a', encoding='utf-8') as f:
-            f.write(toc)
-            f.write(pages[0])
-        write_out = len(pages)
-        for i in range(2, write_out + 1):
-            bad_page = "<table border=\"1\">\n        <tr>\n        <th>Web Request Info</th>\n        <th>Web Screenshot</th>\n        </tr></table><br>\n<center><br><a "
-            badd_page2 = "</center>EW_REPLACEME<table border=\"1\">\n        <tr>\n        <th>Web Request Info</th>\n        <th>Web Screenshot</th>\n        </tr></table><br>"
-            if (bad_page in pages[i-1]) or (badd_page2 in pages[i-1]):
-                pass
-            else:
-                with open(os.path.join(cli_parsed.d, 'report_page{0}.html'.format(str(i))), 'w', encoding='utf-8') as f:
-                    f.write(pages[i - 1])
+    # Add our errors here (at the very very end)
+    if error_count > 0:
+        pager.start_section('Errors')
+        for obj in dbm.iter_error_http():
+            pager.add(obj.create_table_html())
+    pager.close()
 
 
 def create_web_index_head(date, time):
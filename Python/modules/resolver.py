@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Up-front DNS resolution for EyeWitness
+Resolves every distinct target host once, concurrently, and stores the
+answers in the DB so browser workers never block on DNS
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from modules.helpers import lookup_host
+from modules.helpers import target_host
+
+# Lookups in flight at once. The system resolver blocks a thread per query,
+# so this bounds both threads and load on the upstream DNS server.
+DNS_THREADS = 50
+
+# Targets read and committed together. Answers are saved chunk by chunk, so
+# an interrupted run keeps what it resolved and --resume picks up from there.
+DNS_CHUNK = 1000
+
+
+def resolve_targets(dbm, threads=DNS_THREADS):
+    """Resolve the hosts of all unresolved incomplete targets
+
+    The same host behind several ports or both schemes is only looked up
+    once, and hosts already in the dns table (e.g. on --resume) are reused.
+
+    Args:
+        dbm (DB_Manager): Open database for the scan
+        threads (int): Concurrent lookups
+
+    Returns:
+        int: Number of distinct hosts looked up
+    """
+    total = dbm.count_unresolved_http()
+    if not total:
+        return 0
+
+    print('[*] Resolving the hosts of {0} targets'.format(total))
+    start = time.time()
+    looked_up = 0
+    targets = dbm.iter_unresolved_http(DNS_CHUNK)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        while True:
+            chunk = list(islice(targets, DNS_CHUNK))
+            if not chunk:
+                break
+            hosts = {}
+            for target in chunk:
+                hosts.setdefault(target_host(target.remote_system), []).append(
+                    target.id)
+            # Hosts an earlier chunk or run already answered
+            answers = dbm.get_dns_answers(hosts)
+            todo = [host for host in hosts if host not in answers]
+            new = dict(zip(todo, pool.map(lookup_host, todo)))
+            answers.update(new)
+            dbm.record_dns(new, [(answers[host], rowid)
+                                 for host, rowids in hosts.items()
+                                 for rowid in rowids])
+            looked_up += len(todo)
+    print('[*] Resolved {0} hosts in {1:.1f} seconds'.format(
+        looked_up, time.time() - start))
+    return looked_up
@@ -47,12 +47,13 @@ class ResourceMonitor:
         
         return is_over, current_mb, limit_mb
     
-    def get_recommended_threads(self, base_threads=None):
+    def get_recommended_threads(self, base_threads=None, tabs=1):
         """
         Get recommended thread count based on available memory
         
         Args:
             base_threads (int): Base thread count (default: CPU cores * 2)
+            tabs (int): Tabs each thread's browser keeps open
             
         Returns:
             int: Recommended thread count
@@ -63,8 +64,8 @@ class ResourceMonitor:
         # Get available memory in GB
         available_gb = psutil.virtual_memory().available / 1024 / 1024 / 1024
         
-        # Estimate ~200MB per thread for Firefox instances
-        max_threads_by_memory = int(available_gb * 1024 / 200)
+        # Estimate ~200MB per browser instance plus ~50MB per extra tab
+        max_threads_by_memory = int(available_gb * 1024 / (200 + 50 * (max(1, tabs) - 1)))
         
         # Use the minimum of CPU-based and memory-based calculations
         recommended = min(base_threads, max_threads_by_memory, 20)
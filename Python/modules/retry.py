@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Retry scheduling for EyeWitness
+Decides which failed captures are worth another attempt and holds them
+back until their backoff expires
+"""
+
+import heapq
+import random
+import time
+
+# Base backoff in seconds for each error_state worth retrying. The delay
+# doubles with every attempt. Refused connections, DNS failures and
+# certificate errors are deterministic and are never retried.
+RETRY_BACKOFF = {
+    'Timeout': 30,
+    'Connection Reset': 10,
+    'Driver Crashed': 5,
+    'Error': 15,
+}
+
+
+def retry_delay(error_state, attempts, max_retries):
+    """Seconds to wait before the next attempt, or None if the failure is final
+
+    Args:
+        error_state (str): error_state of the failed capture
+        attempts (int): Retries already made for the target
+        max_retries (int): --max-retries
+
+    Returns:
+        float: Backoff with +/-20% jitter, None when no retry should happen
+    """
+    base = RETRY_BACKOFF.get(error_state)
+    if base is None or attempts >= max_retries:
+        return None
+    return base * (2 ** attempts) * random.uniform(0.8, 1.2)
+
+
+class RetryScheduler(object):
+
+    """Hold failed targets until their backoff expires
+
+    Due targets are put at the tail of the pending work, so a retry never
+    jumps ahead of first-pass work that is already waiting.
+    """
+
+    def __init__(self, targets):
+        """
+        Args:
+            targets (Queue|HostScheduler): Where due targets are put
+        """
+        self._targets = targets
+        self._heap = []
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, due, http_object):
+        # The sequence number keeps equal due times in arrival order and
+        # stops heapq from ever comparing two objects
+        heapq.heappush(self._heap, (due, self._sequence, http_object))
+        self._sequence += 1
+
+    def release_due(self, now=None):
+        """Queue every target whose backoff has expired, returns how many"""
+        now = time.time() if now is None else now
+        released = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, http_object = heapq.heappop(self._heap)
+            self._targets.put(http_object)
+            released += 1
+        return released
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Per-host politeness scheduling for EyeWitness
+Interleaves targets across hosts so no host is hit more often or more
+concurrently than allowed, while every other host keeps the workers busy
+"""
+
+import heapq
+import random
+import time
+from collections import deque
+
+from netaddr import INET_PTON
+from netaddr import valid_ipv4
+
+from modules.helpers import target_host
+
+
+def host_key(http_object, subnet=False):
+    """Politeness bucket a target belongs to
+
+    Names are grouped by the address they resolved to, so several names or
+    ports on one box share a bucket.
+
+    Args:
+        http_object (HTTPTableObject): Target
+        subnet (bool): Group IPv4 addresses by /24
+
+    Returns:
+        str: Bucket key
+    """
+    address = target_host(http_object.remote_system).lower()
+    resolved = http_object.resolved or ''
+    if not valid_ipv4(address, INET_PTON) and valid_ipv4(resolved, INET_PTON):
+        address = resolved
+    if subnet and valid_ipv4(address, INET_PTON):
+        return '.'.join(address.split('.')[:3]) + '.0/24'
+    return address
+
+
+class HostScheduler(object):
+
+    """Hand out targets round-robin across hosts under per-host limits
+
+    Every host has a token bucket holding one token that refills interval
+    seconds (randomized 70-100%, as --jitter always was) after each request
+    starts, and at most max_per_host of its targets may be out at once.
+    Hosts with work and a free slot wait in a ready rotation; hosts waiting
+    on their bucket sit in a heap by refill time; hosts at their
+    concurrency limit are parked until done() frees a slot.
+
+    Targets go straight into the queue of the worker that will capture
+    them, so the owner of every target handed out is known here and a lost
+    worker's targets can be taken back (take_back()).
+    """
+
+    def __init__(self, max_per_host=0, interval=0, subnet=False):
+        """
+        Args:
+            max_per_host (int): Concurrent targets per host (0 is unlimited)
+            interval (float): Seconds between request starts to one host
+            subnet (bool): Apply the limits per IPv4 /24 instead of per host
+        """
+        self.max_per_host = max_per_host
+        self.interval = interval
+        self.subnet = subnet
+        self._queues = {}
+        self._in_flight = {}
+        self._refill = {}
+        self._owners = {}
+        self._by_worker = {}
+        self._ready = deque()
+        self._waiting = []
+        self._scheduled = set()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def put(self, http_object):
+        """Queue-style add of a target (anything with id, remote_system and
+        resolved, e.g. a db_manager.Target)"""
+        key = host_key(http_object, self.subnet)
+        self._queues.setdefault(key, deque()).append(http_object)
+        self._count += 1
+        self._schedule(key, time.time())
+
+    def _schedule(self, key, now):
+        if key in self._scheduled or key not in self._queues:
+            return
+        if self.max_per_host and self._in_flight.get(key, 0) >= self.max_per_host:
+            return
+        refill = self._refill.get(key, 0)
+        if refill > now:
+            heapq.heappush(self._waiting, (refill, key))
+        else:
+            self._ready.append(key)
+        self._scheduled.add(key)
+
+    def dispatch(self, workers, depth, now=None):
+        """Hand out targets to the least loaded workers
+
+        Args:
+            workers (dict): {worker name: work queue the worker reads ids from}
+            depth (int): Most targets out to one worker at a time, loading
+                or waiting in its queue
+
+        Returns:
+            int: Targets handed out
+        """
+        now = time.time() if now is None else now
+        while self._waiting and self._waiting[0][0] <= now:
+            _, key = heapq.heappop(self._waiting)
+            self._ready.append(key)
+        loads = [(len(self._by_worker.get(name, ())), name) for name in workers]
+        loads = [load for load in loads if load[0] < depth]
+        heapq.heapify(loads)
+        sent = 0
+        while loads and self._ready:
+            load, worker = heapq.heappop(loads)
+            key = self._ready.popleft()
+            self._scheduled.discard(key)
+            pending = self._queues[key]
+            http_object = pending.popleft()
+            if not pending:
+                del self._queues[key]
+            self._count -= 1
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            if self.interval:
+                self._refill[key] = now + self.interval * random.uniform(0.7, 1.0)
+            self._owners[http_object.id] = (key, http_object, worker)
+            self._by_worker.setdefault(worker, set()).add(http_object.id)
+            workers[worker].put(http_object.id)
+            if load + 1 < depth:
+                heapq.heappush(loads, (load + 1, worker))
+            sent += 1
+            # Back of the rotation, or into the heap until its bucket refills
+            self._schedule(key, now)
+        return sent
+
+    def done(self, rowid):
+        """A handed out target finished (or went back for a retry)
+
+        Returns:
+            The target that was handed out under rowid, None if unknown
+        """
+        owner = self._owners.pop(rowid, None)
+        if owner is None:
+            return None
+        key, target, worker = owner
+        owned = self._by_worker[worker]
+        owned.discard(rowid)
+        if not owned:
+            del self._by_worker[worker]
+        self._in_flight[key] -= 1
+        if not self._in_flight[key]:
+            del self._in_flight[key]
+            if key not in self._queues and self._refill.get(key, 0) <= time.time():
+                self._refill.pop(key, None)
+        self._schedule(key, time.time())
+        return target
+
+    def owner(self, rowid):
+        """Name of the worker a target was handed to, None if it is not out"""
+        owner = self._owners.get(rowid)
+        return None if owner is None else owner[2]
+
+    def take_back(self, worker):
+        """Take back every target handed to a worker that is gone
+
+        Returns:
+            list: The targets, loading or still waiting in its queue
+        """
+        return [self.done(rowid) for rowid in sorted(self._by_worker.get(worker, ()))]
@@ -5,6 +5,7 @@ Simplified single-browser approach using Chrome/Chromium headless
 """
 
 import http.client
+import json
 import os
 import socket
 import sys
@@ -13,6 +14,7 @@ import urllib.error
 import ssl
 import shutil
 import tempfile
+import time
 from pathlib import Path
 
 try:
@@ -34,7 +36,6 @@ except ImportError:
     print('[*] Try: sudo apt install python3-selenium')
     sys.exit()
 
-from modules.helpers import do_delay
 from modules.platform_utils import platform_mgr
 from modules.security_headers import collect_http_headers
 
@@ -97,6 +98,17 @@ def create_driver(cli_parsed, user_agent=None):
         
         # Security and certificate handling
         options.accept_insecure_certs = True
+
+        # Tabs are driven by polling, so navigation must not block
+        if getattr(cli_parsed, 'tabs', 1) > 1:
+            options.page_load_strategy = 'none'
+
+        # Record network events so response headers come from the navigation
+        # itself instead of a second request
+        if getattr(cli_parsed, 'header_source', 'browser') == 'browser':
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+            options.add_experimental_option('perfLoggingPrefs', {
+                'enableNetwork': True, 'enablePage': False})
         
         # Setup Chrome service
         service_kwargs = {}
@@ -165,24 +177,316 @@ def find_chromedriver():
     return None
 
 
-def capture_host(cli_parsed, http_object, driver, ua=None):
-    """Screenshots a single host using Chrome and returns updated HTTP Object
-    
-    Enhanced version that collects HTTP headers and performs security analysis
-    alongside Selenium screenshot capture.
-    
+# Browser lifecycle counters for this process, merged into the run summary
+driver_stats = {
+    'launches': 0,
+    'launch_seconds': 0.0,
+    'restarts': 0,
+    'recoveries': 0,
+}
+
+
+def launch_driver(cli_parsed, user_agent=None):
+    """create_driver() that records how long the launch took
+
+    Returns:
+        tuple: (WebDriver, seconds taken)
+    """
+    launch_start = time.time()
+    driver = create_driver(cli_parsed, user_agent)
+    elapsed = time.time() - launch_start
+    driver_stats['launches'] += 1
+    driver_stats['launch_seconds'] += elapsed
+    return driver, elapsed
+
+
+def restart_driver(cli_parsed, driver, user_agent=None):
+    """Quit a broken driver and launch a replacement"""
+    try:
+        driver.quit()
+    except Exception:
+        pass
+    driver_stats['restarts'] += 1
+    return launch_driver(cli_parsed, user_agent)[0]
+
+
+def stop_loading(driver):
+    """Abort the navigation in the current window"""
+    try:
+        driver.execute_cdp_cmd('Page.stopLoading', {})
+    except WebDriverException:
+        driver.execute_script('window.stop();')
+
+
+def driver_healthy(driver):
+    """Cheap probe that the browser still answers and can navigate"""
+    try:
+        driver.get('about:blank')
+        return driver.execute_script('return 1;') == 1
+    except Exception:
+        return False
+
+
+def recover_from_timeout(cli_parsed, http_object, driver, ua=None, response=None):
+    """Salvage a timed out page without restarting the browser
+
+    The load is stopped and whatever rendered so far is captured. The browser
+    is only replaced if it fails the health probe afterwards.
+
     Args:
-        cli_parsed (ArgumentParser): Command Line Object  
-        http_object (HTTPObject): HTTP Object
-        driver (WebDriver): Selenium WebDriver
+        cli_parsed (ArgumentParser): Command Line Object
+        http_object (HTTPObject): HTTP Object, error_state already Timeout
+        driver (WebDriver): Selenium WebDriver on the timed out page
         ua (str, optional): User agent string
-        
+        response (tuple, optional): (headers, status code) seen for the page
+
     Returns:
-        tuple: (HTTPObject, WebDriver) Updated objects
+        WebDriver: The same driver, or a replacement if it was unhealthy
+    """
+    try:
+        stop_loading(driver)
+        if response is None and getattr(cli_parsed, 'header_source', 'browser') == 'browser':
+            response = document_response_from_log(driver)
+        finish_capture(cli_parsed, http_object, driver, ua, response,
+                       header_fallback=False)
+    except Exception as e:
+        if driver_crashed(e):
+            return restart_driver(cli_parsed, driver, ua)
+        print(f'[*] No partial capture for {http_object.remote_system}')
+
+    if driver_healthy(driver):
+        driver_stats['recoveries'] += 1
+        return driver
+    print(f'[*] Chrome driver became unresponsive - restarting')
+    return restart_driver(cli_parsed, driver, ua)
+
+
+def drain_performance_log(driver):
+    """Discard buffered performance log entries left over from earlier pages"""
+    try:
+        driver.get_log('performance')
+    except WebDriverException:
+        pass
+
+
+def document_events(entries):
+    """Outcome of the document load in each frame from performance log entries
+
+    Chrome reports the final response of a navigation (after redirects) as a
+    Network.responseReceived event of type Document. A navigation that never
+    got a response ends in Network.loadingFailed instead.
+
+    Args:
+        entries (list): Entries returned by driver.get_log('performance')
+
+    Returns:
+        dict: {frame id: (headers dict, status code, error text)} in the
+            order the frames first reported, first outcome per frame
+    """
+    request_frames = {}
+    events = {}
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if params.get('type') != 'Document':
+            continue
+        if method == 'Network.requestWillBeSent':
+            request_frames[params.get('requestId')] = params.get('frameId')
+        elif method == 'Network.responseReceived':
+            frame = params.get('frameId')
+            if frame in events:
+                continue
+            response = params.get('response', {})
+            headers = {}
+            for name, value in response.get('headers', {}).items():
+                # Repeated headers arrive newline-joined
+                headers[name] = str(value).replace('\n', ', ')
+            events[frame] = (headers, response.get('status'), None)
+        elif method == 'Network.loadingFailed' and not params.get('canceled'):
+            frame = request_frames.get(params.get('requestId'))
+            if frame is not None and frame not in events:
+                events[frame] = (None, None, params.get('errorText'))
+    return events
+
+
+def main_frame_id(driver):
+    """DevTools id of the current window's top frame, None if unavailable"""
+    try:
+        return driver.execute_cdp_cmd(
+            'Page.getFrameTree', {})['frameTree']['frame']['id']
+    except (WebDriverException, KeyError, TypeError):
+        return None
+
+
+def document_response_from_log(driver):
+    """Main document response headers and status from the performance log
+
+    Args:
+        driver (WebDriver): Selenium WebDriver, drained before the navigation
+
+    Returns:
+        tuple: (headers dict or None, status code or None)
+    """
+    try:
+        entries = driver.get_log('performance')
+    except WebDriverException:
+        return None, None
+
+    events = document_events(entries)
+    main_frame = main_frame_id(driver)
+    if main_frame is not None:
+        headers, status_code, _ = events.get(main_frame, (None, None, None))
+        return headers, status_code
+    for headers, status_code, _ in events.values():
+        if headers is not None:
+            return headers, status_code
+    return None, None
+
+
+# A loaded page counts as settled once no resource has finished loading for
+# this many milliseconds
+QUIET_MS = 500
+
+# Seconds between readiness probes while waiting on a page
+READY_POLL = 0.1
+
+# One round trip reports everything page_settled() needs. Resource timing
+# entries only appear once a request finishes, so "quiet" is the time since
+# the last one did (or since the load event).
+READY_PROBE = """
+var resources = performance.getEntriesByType('resource');
+var last = 0;
+for (var i = 0; i < resources.length; i++) {
+    last = Math.max(last, resources[i].responseEnd);
+}
+var nav = performance.getEntriesByType('navigation')[0];
+if (nav) {
+    last = Math.max(last, nav.loadEventEnd);
+}
+return {
+    readyState: document.readyState,
+    location: location.href,
+    painted: performance.getEntriesByName('first-contentful-paint').length > 0 ||
+        !document.body || document.body.childElementCount === 0,
+    quietMs: performance.now() - last
+};
+"""
+
+
+def probe_readiness(driver):
+    """Run READY_PROBE in the current window"""
+    return driver.execute_script(READY_PROBE) or {}
+
+
+def page_settled(probe):
+    """True once the load event fired, content painted and the network is quiet"""
+    return (probe.get('readyState') == 'complete' and bool(probe.get('painted')) and
+            (probe.get('quietMs') or 0) >= QUIET_MS)
+
+
+def ready_limits(cli_parsed):
+    """(minimum, maximum) seconds to wait on a loaded page
+
+    --delay is a floor every page waits out, --ready-timeout caps the wait
+    for pages that never settle.
+    """
+    delay = getattr(cli_parsed, 'delay', 0) or 0
+    cap = getattr(cli_parsed, 'ready_timeout', 3)
+    return delay, max(delay, cap)
+
+
+def wait_until_ready(cli_parsed, driver):
+    """Wait for the page in the current window to settle, up to the cap
+
+    Static pages are usually settled by the time driver.get() returns and
+    are shot at once; only pages still fetching or rendering are waited on.
+    """
+    delay, cap = ready_limits(cli_parsed)
+    start = time.time()
+    while True:
+        waited = time.time() - start
+        try:
+            probe = probe_readiness(driver)
+        except WebDriverException as e:
+            if driver_crashed(e):
+                raise
+            return
+        if waited >= delay and page_settled(probe):
+            return
+        if waited >= cap:
+            return
+        time.sleep(READY_POLL)
+
+
+# Chrome network errors mapped to (error_state, message)
+NET_ERRORS = [
+    ('net::err_connection_reset', 'Connection Reset',
+     'Connection reset by {0} - target may be blocking requests'),
+    ('net::err_connection_refused', 'Connection Refused',
+     'Connection refused by {0} - service may be down'),
+    ('net::err_timed_out', 'Timeout', 'Timeout connecting to {0}'),
+    ('net::err_name_not_resolved', 'DNS Failed', 'DNS resolution failed for {0}'),
+    ('net::err_cert_', 'SSL Error', 'SSL/Certificate error for {0}'),
+]
+
+
+def classify_error(error_msg, remote_system):
+    """Map a browser error message to an error_state and print why
+
+    Args:
+        error_msg (str): Exception text or net::ERR_* error text
+        remote_system (str): Target, for the message
+
+    Returns:
+        str: error_state for the HTTPTableObject
+    """
+    error_text = str(error_msg)
+    error_msg = error_text.lower()
+    for marker, error_state, message in NET_ERRORS:
+        if marker in error_msg:
+            print('[*] ' + message.format(remote_system))
+            return error_state
+    if 'timeout' in error_msg:
+        print(f'[*] Timeout connecting to {remote_system}')
+        return 'Timeout'
+    if 'certificate' in error_msg:
+        print(f'[*] SSL/Certificate error for {remote_system}')
+        return 'SSL Error'
+    print(f'[*] Error capturing screenshot for {remote_system}: {error_text}')
+    return 'Error'
+
+
+def driver_crashed(error_msg):
+    """True if a WebDriver error means the browser itself is gone"""
+    error_msg = str(error_msg).lower()
+    return ('chrome not reachable' in error_msg or 'session deleted' in error_msg or
+            'invalid session id' in error_msg)
+
+
+def store_headers(http_object, headers):
+    """Store raw headers plus a truncated copy for display in the report"""
+    http_object.http_headers = headers
+
+    formatted_headers = {}
+    for key, value in headers.items():
+        # Truncate long header values for display
+        display_value = value[:150] + "..." if len(value) > 150 else value
+        formatted_headers[key] = display_value
+    http_object.headers = formatted_headers
+
+
+def request_headers(cli_parsed, http_object, ua=None):
+    """Collect headers with a separate HTTP request
+
+    Used when --header-source is request, or as a fallback when the browser
+    log had no document response.
     """
-    # Step 1: Collect HTTP headers via HTTP client (before Selenium)
     print(f'[*] Collecting headers for {http_object.remote_system}')
-    
+
     # Set up proxy configuration if provided
     proxy_config = None
     if hasattr(cli_parsed, 'proxy_ip') and cli_parsed.proxy_ip:
@@ -190,7 +494,7 @@ def capture_host(cli_parsed, http_object, driver, ua=None):
             'ip': cli_parsed.proxy_ip,
             'port': getattr(cli_parsed, 'proxy_port', 8080)
         }
-    
+
     # Collect headers with HTTP client
     headers, header_error = collect_http_headers(
         url=http_object.remote_system,
@@ -198,21 +502,9 @@ def capture_host(cli_parsed, http_object, driver, ua=None):
         user_agent=ua or getattr(cli_parsed, 'user_agent', None),
         proxy=proxy_config
     )
-    
-    # Store headers in HTTPTableObject
+
     if headers:
-        # Store raw headers in HTTPTableObject
-        http_object.http_headers = headers
-        
-        # Create formatted headers display for the report
-        formatted_headers = {}
-        for key, value in headers.items():
-            # Truncate long header values for display
-            display_value = value[:150] + "..." if len(value) > 150 else value
-            formatted_headers[key] = display_value
-        
-        http_object.headers = formatted_headers
-        
+        store_headers(http_object, headers)
         print(f'[+] Headers collected: {len(headers)} headers')
     else:
         # Handle header collection failure
@@ -222,113 +514,130 @@ def capture_host(cli_parsed, http_object, driver, ua=None):
         else:
             print(f'[!] No headers received from {http_object.remote_system}')
             http_object.headers = {"Headers": "No headers received"}
-    
-    # Step 2: Continue with Selenium screenshot capture
+
+
+def finish_capture(cli_parsed, http_object, driver, ua=None, response=None,
+                   header_fallback=True):
+    """Store headers, page source and screenshot of the page in the current window
+
+    Args:
+        cli_parsed (ArgumentParser): Command Line Object
+        http_object (HTTPObject): HTTP Object being captured
+        driver (WebDriver): Selenium WebDriver showing the loaded page
+        ua (str, optional): User agent string, for the header fallback
+        response (tuple, optional): (headers, status code) of the document
+            from the performance log
+        header_fallback (bool): Request the headers separately when the log
+            had none (skipped for partial pages, which would only time out)
+    """
+    if getattr(cli_parsed, 'header_source', 'browser') == 'browser':
+        headers, status_code = response or (None, None)
+        if headers:
+            store_headers(http_object, headers)
+            http_object.status_code = status_code
+        elif header_fallback:
+            request_headers(cli_parsed, http_object, ua)
+
+    # Capture page content
+    http_object.source_code = driver.page_source.encode('utf-8')
+    http_object.page_title = driver.title
+
+
+    # Persist source_code to the source folder using the same filename strategy
+    try:
+        # Normalize bytes
+        src_bytes = http_object.source_code
+        if isinstance(src_bytes, str):
+            src_bytes = src_bytes.encode('utf-8')
+        # Prefer an already-set source_path
+        if getattr(http_object, 'source_path', None):
+            dest = Path(http_object.source_path)
+        else:
+            # Build filename like set_paths()
+            file_name = http_object.remote_system.replace('://', '.')
+            for char in [':', '/', '?', '=', '%', '+']:
+                file_name = file_name.replace(char, '.')
+            dest = Path(cli_parsed.d) / 'source' / f'{file_name}.txt'
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with open(dest, 'wb') as sf:
+            sf.write(src_bytes)
+        http_object.source_path = str(dest)
+    except Exception as e:
+        print(f'[!] Warning: failed to write page source for {http_object.remote_system}: {e}')
+
+
+    # Take screenshot - properly sanitize filename
+    def sanitize_filename(url):
+        import re
+        # Remove protocol and sanitize all unsafe characters
+        filename = re.sub(r'^https?://', '', url)
+        # Replace all non-alphanumeric characters (except hyphens and dots) with underscores
+        filename = re.sub(r'[^a-zA-Z0-9\-\.]', '_', filename)
+        # Limit length to prevent filesystem issues
+        return filename[:200]
+
+    safe_filename = sanitize_filename(http_object.remote_system)
+    screenshot_path = Path(cli_parsed.d) / 'screens' / f'{safe_filename}.png'
+    driver.save_screenshot(str(screenshot_path))
+    http_object.screenshot_path = str(screenshot_path)
+
+    print(f'[+] Captured screenshot: {http_object.remote_system}')
+
+
+def capture_host(cli_parsed, http_object, driver, ua=None):
+    """Screenshots a single host using Chrome and returns updated HTTP Object
+
+    Response headers and the status code are read from Chrome's performance
+    log for the same navigation that produces the screenshot. A separate HTTP
+    request is only made with --header-source request, or when the log has
+    no document response.
+
+    Args:
+        cli_parsed (ArgumentParser): Command Line Object  
+        http_object (HTTPObject): HTTP Object
+        driver (WebDriver): Selenium WebDriver
+        ua (str, optional): User agent string
+        
+    Returns:
+        tuple: (HTTPObject, WebDriver) Updated objects
+    """
+    from_browser = getattr(cli_parsed, 'header_source', 'browser') == 'browser'
+    if not from_browser:
+        request_headers(cli_parsed, http_object, ua)
+
+    # Navigate once; headers, source and screenshot all come from this load
     try:
         print(f'[*] Taking screenshot of {http_object.remote_system}')
+        if from_browser:
+            drain_performance_log(driver)
         driver.get(http_object.remote_system)
         
-        # Handle page load timeout
-        try:
-            # Wait for page to load
-            driver.implicitly_wait(3)
-        except TimeoutException:
-            pass  # Continue with screenshot anyway
-            
-        # Capture page content
-        http_object.source_code = driver.page_source.encode('utf-8')
-        http_object.page_title = driver.title
+        # Give late resources and client-side rendering a chance to finish
+        wait_until_ready(cli_parsed, driver)
 
+        response = None
+        if from_browser:
+            response = document_response_from_log(driver)
+        finish_capture(cli_parsed, http_object, driver, ua, response)
 
-        # Persist source_code to the source folder using the same filename strategy
-        try:
-            # Normalize bytes
-            src_bytes = http_object.source_code
-            if isinstance(src_bytes, str):
-                src_bytes = src_bytes.encode('utf-8')
-            # Prefer an already-set source_path
-            if getattr(http_object, 'source_path', None):
-                dest = Path(http_object.source_path)
-            else:
-                # Build filename like set_paths()
-                file_name = http_object.remote_system.replace('://', '.')
-                for char in [':', '/', '?', '=', '%', '+']:
-                    file_name = file_name.replace(char, '.')
-                dest = Path(cli_parsed.d) / 'source' / f'{file_name}.txt'
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            with open(dest, 'wb') as sf:
-                sf.write(src_bytes)
-            http_object.source_path = str(dest)
-        except Exception as e:
-            print(f'[!] Warning: failed to write page source for {http_object.remote_system}: {e}')
-        
-        
-        # Take screenshot - properly sanitize filename
-        def sanitize_filename(url):
-            import re
-            # Remove protocol and sanitize all unsafe characters
-            filename = re.sub(r'^https?://', '', url)
-            # Replace all non-alphanumeric characters (except hyphens and dots) with underscores
-            filename = re.sub(r'[^a-zA-Z0-9\-\.]', '_', filename)
-            # Limit length to prevent filesystem issues
-            return filename[:200]
-            
-        safe_filename = sanitize_filename(http_object.remote_system)
-        screenshot_path = Path(cli_parsed.d) / 'screens' / f'{safe_filename}.png'
-        driver.save_screenshot(str(screenshot_path))
-        http_object.screenshot_path = str(screenshot_path)
-        
-        print(f'[+] Captured screenshot: {http_object.remote_system}')
-        
     except TimeoutException:
         print(f'[*] Timeout connecting to {http_object.remote_system}')
-        driver.quit()
-        driver = create_driver(cli_parsed, ua)
         http_object.error_state = 'Timeout'
+        driver = recover_from_timeout(cli_parsed, http_object, driver, ua)
         
     except Exception as e:
-        error_msg = str(e).lower()
-        
-        # Enhanced error handling with specific error types
-        if 'net::err_connection_reset' in error_msg:
-            print(f'[*] Connection reset by {http_object.remote_system} - target may be blocking requests')
-            http_object.error_state = 'Connection Reset'
-        elif 'net::err_connection_refused' in error_msg:
-            print(f'[*] Connection refused by {http_object.remote_system} - service may be down')
-            http_object.error_state = 'Connection Refused'
-        elif 'net::err_timed_out' in error_msg or 'timeout' in error_msg:
-            print(f'[*] Timeout connecting to {http_object.remote_system}')
-            http_object.error_state = 'Timeout'
-        elif 'net::err_name_not_resolved' in error_msg:
-            print(f'[*] DNS resolution failed for {http_object.remote_system}')
-            http_object.error_state = 'DNS Failed'
-        elif 'net::err_cert_' in error_msg or 'certificate' in error_msg:
-            print(f'[*] SSL/Certificate error for {http_object.remote_system}')
-            http_object.error_state = 'SSL Error'
-        elif 'chrome not reachable' in error_msg or 'session deleted' in error_msg:
+        if driver_crashed(e):
             print(f'[*] Chrome driver crashed while accessing {http_object.remote_system} - restarting')
             http_object.error_state = 'Driver Crashed'
             # Force driver restart
-            try:
-                driver.quit()
-            except:
-                pass
-            driver = create_driver(cli_parsed, ua)
+            driver = restart_driver(cli_parsed, driver, ua)
             return http_object, driver
-        else:
-            print(f'[*] Error capturing screenshot for {http_object.remote_system}: {e}')
-            http_object.error_state = 'Error'
-        
+        http_object.error_state = classify_error(e, http_object.remote_system)
+
         # Test if driver is still responsive
-        try:
-            driver.get('about:blank')
-        except:
+        if not driver_healthy(driver):
             print(f'[*] Chrome driver became unresponsive - restarting')
-            try:
-                driver.quit()
-            except:
-                pass
-            driver = create_driver(cli_parsed, ua)
+            driver = restart_driver(cli_parsed, driver, ua)
     
     return http_object, driver
 
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Signature and category matching for EyeWitness
+Compiles signatures.txt and categories.txt into a single multi-pattern index
+"""
+
+from collections import deque
+from pathlib import Path
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+
+class SignatureMatcher:
+    """Match page sources against every signature and category in one pass
+
+    Every ';'-separated fragment from both definition files is lowercased and
+    added to an Aho-Corasick automaton. A page is lowercased once and scanned
+    once; a definition matches when all of its fragments were seen.
+    """
+
+    def __init__(self, signatures, categories):
+        """
+        Args:
+            signatures (list): (fragments, credential info) tuples
+            categories (list): (fragments, category name) tuples
+        """
+        self._fragments = {}
+        self.signatures = [(self._index(frags), value) for frags, value in signatures]
+        self.categories = [(self._index(frags), value) for frags, value in categories]
+        self._build()
+
+    @classmethod
+    def from_files(cls, sigpath, catpath):
+        """Load definitions from disk (raises IOError if either file is missing)"""
+        return cls(cls._parse(sigpath), cls._parse(catpath))
+
+    @staticmethod
+    def _parse(path):
+        definitions = []
+        with open(path) as def_file:
+            for line in def_file:
+                if '|' not in line:
+                    continue
+                # Fragments before the "|" must all be present, the value
+                # after it is the credential info or category name
+                left, right = line.split('|')[:2]
+                definitions.append((left.split(';'), right.strip()))
+        return definitions
+
+    def _index(self, fragments):
+        ids = set()
+        for fragment in fragments:
+            fragment = fragment.lower()
+            if fragment == '':
+                # An empty fragment is found in any page, so it adds no condition
+                continue
+            ids.add(self._fragments.setdefault(fragment, len(self._fragments)))
+        return frozenset(ids)
+
+    def _build(self):
+        if HAS_AHOCORASICK:
+            self._automaton = ahocorasick.Automaton()
+            for fragment, frag_id in self._fragments.items():
+                self._automaton.add_word(fragment, frag_id)
+            self._automaton.make_automaton()
+            return
+
+        # Pure Python automaton: goto transitions, failure links and the
+        # fragment ids that end at each state
+        goto = [{}]
+        outputs = [()]
+        for fragment, frag_id in self._fragments.items():
+            state = 0
+            for char in fragment:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                    goto[state][char] = nxt
+                state = nxt
+            outputs[state] += (frag_id,)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                link = goto[link].get(char, 0)
+                fail[nxt] = link if link != nxt else 0
+                outputs[nxt] += outputs[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+
+    def find_fragments(self, text):
+        """Return the set of fragment ids present in already-lowercased text"""
+        if HAS_AHOCORASICK:
+            return {frag_id for _, frag_id in self._automaton.iter(text)}
+
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found = set()
+        state = 0
+        for char in text:
+            while True:
+                nxt = goto[state].get(char)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    def match(self, source_code):
+        """Match a page source against all definitions
+
+        Args:
+            source_code (bytes|str): Page source
+
+        Returns:
+            tuple: (list of matching credential strings in file order,
+                    first matching category name or None)
+        """
+        if isinstance(source_code, bytes):
+            source_code = source_code.decode()
+        found = self.find_fragments(source_code.lower())
+
+        creds = [value for ids, value in self.signatures if ids <= found]
+        category = None
+        for ids, value in self.categories:
+            if ids <= found:
+                category = value
+                break
+        return creds, category
+
+
+_matcher = None
+
+
+def get_signature_matcher():
+    """Return the process-wide matcher, compiling it on first use
+
+    Returns:
+        SignatureMatcher: Compiled matcher
+
+    Raises:
+        IOError: signatures.txt or categories.txt could not be read
+    """
+    global _matcher
+    if _matcher is None:
+        base_dir = Path(__file__).parent.parent
+        _matcher = SignatureMatcher.from_files(
+            base_dir / 'signatures.txt', base_dir / 'categories.txt')
+    return _matcher
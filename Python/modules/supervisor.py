@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Worker supervision for EyeWitness
+Restarts capture workers that die or hang mid-scan and hands the targets
+they had claimed back to the scheduler, so a crashed browser costs one
+capture attempt instead of the rest of that worker's share of the scan
+"""
+
+import time
+
+from modules.selenium_module import ready_limits
+
+# Slack on top of the page timeout and readiness cap before a claim counts
+# as abandoned. Covers a driver restart inside the capture.
+LEASE_MARGIN = 120
+
+# Seconds between supervision rounds
+CHECK_INTERVAL = 5
+
+
+def lease_seconds(cli_parsed):
+    """How long a worker may hold a target before it is presumed hung"""
+    return getattr(cli_parsed, 'timeout', 7) + ready_limits(cli_parsed)[1] + LEASE_MARGIN
+
+
+class WorkerSupervisor(object):
+
+    """Keep a fixed number of capture workers running
+
+    Every worker reads target ids from its own queue, and the HostScheduler
+    records which worker each target went to, so what a lost worker held is
+    known without asking it. A worker that exits while the scan is still
+    running has crashed, and one holding a target past its lease (see
+    WriterClient.claim) has hung and is killed. Either way a replacement is
+    started and its targets are rescheduled. The ones it had started on
+    count a retry, and are finalized as 'Driver Crashed' once they have
+    used up their retries, since a target that keeps taking its browser
+    down is not worth another worker.
+    """
+
+    def __init__(self, dbm, writes, start_worker, count, max_retries=1,
+                 max_restarts=None):
+        """
+        Args:
+            dbm (DB_Manager): Open database for the scan, only read from
+            writes (WriterClient): Sends the supervisor's writes to the
+                DBWriter, in order with the workers' records
+            start_worker (callable): Starts a new worker, returns the
+                Process and the work queue it reads from
+            count (int): Workers to keep running
+            max_retries (int): --max-retries
+            max_restarts (int, optional): Replacements started before giving
+                up, defaults to five per worker
+        """
+        self.dbm = dbm
+        self.writes = writes
+        self.start_worker = start_worker
+        self.max_retries = max_retries
+        self.max_restarts = count * 5 if max_restarts is None else max_restarts
+        self.restarts = 0
+        # Claims left behind by an earlier, interrupted run
+        writes.release_claims()
+        self.workers = []
+        self.queues = {}
+        for _ in range(count):
+            self._start()
+        self._next_check = time.time() + CHECK_INTERVAL
+
+    def _start(self):
+        worker, targets = self.start_worker()
+        self.workers.append(worker)
+        self.queues[worker.name] = targets
+
+    def alive(self):
+        return [w for w in self.workers if w.is_alive()]
+
+    def stop(self):
+        """Tell every worker there is no more work and wait for them"""
+        for targets in self.queues.values():
+            targets.put(None)
+        for w in self.workers:
+            w.join()
+
+    def check(self, hosts, counter, drain=None, now=None):
+        """Replace dead or hung workers and reschedule what they held
+
+        Args:
+            hosts (HostScheduler): Scheduler the targets were handed out by
+            counter (Value): Targets finished for good
+            drain (callable, optional): Handles the events still queued, so
+                targets a lost worker reported done are not taken back
+
+        Returns:
+            int: Targets taken back from lost workers
+        """
+        now = time.time() if now is None else now
+        if now < self._next_check:
+            return 0
+        self._next_check = now + CHECK_INTERVAL
+
+        lost = [w for w in self.workers if not w.is_alive()]
+        for rowid, worker in self.dbm.get_expired_claims(now):
+            if hosts.owner(rowid) != worker:
+                # Reported done, the result is just not written yet
+                continue
+            for w in self.workers:
+                if w.name == worker and w not in lost and w.is_alive():
+                    print('[!] {0} is stuck on a target, restarting it'.format(w.name))
+                    w.terminate()
+                    w.join(5)
+                    lost.append(w)
+        if not lost:
+            return 0
+
+        for w in lost:
+            print('[!] {0} exited unexpectedly (exit code {1})'.format(
+                w.name, w.exitcode))
+        if drain is not None:
+            # Lost workers send nothing more, all they reported is queued
+            drain()
+        reclaimed = self._reclaim(hosts, counter, [w.name for w in lost])
+
+        for w in lost:
+            self.workers.remove(w)
+            del self.queues[w.name]
+            if self.restarts < self.max_restarts:
+                self._start()
+                self.restarts += 1
+        if self.restarts >= self.max_restarts:
+            print('[!] Worker restart limit reached, continuing with {0} '
+                  'workers'.format(len(self.alive())))
+        return reclaimed
+
+    def _reclaim(self, hosts, counter, workers):
+        reclaimed = 0
+        for worker in workers:
+            targets = hosts.take_back(worker)
+            claims = self.dbm.get_claims([target.id for target in targets])
+            for target in targets:
+                claimed_by, retries = claims.get(target.id, (None, 0))
+                if claimed_by != worker:
+                    # Never loaded, or the claim is not written yet; either
+                    # way it gets another go without counting a retry
+                    hosts.put(target)
+                elif retries >= self.max_retries:
+                    print('[*] Giving up on {0} after it crashed its browser'.format(
+                        target.remote_system))
+                    self.writes.fail_http_object(target.id, 'Driver Crashed')
+                    with counter.get_lock():
+                        counter.value += 1
+                else:
+                    self.writes.set_retries(target.id, retries + 1)
+                    hosts.put(target)
+                reclaimed += 1
+        self.writes.release_claims(workers)
+        if reclaimed:
+            print('[*] Rescheduled {0} targets from lost workers'.format(reclaimed))
+        return reclaimed
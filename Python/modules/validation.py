@@ -6,9 +6,28 @@ Provides robust validation for URLs and other user inputs
 
 import re
 import socket
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse, urlsplit, urlunparse
 import ipaddress
 
+# Compiled once at import, validate_url runs for every line of input files
+HOSTNAME_REGEX = re.compile(
+    r'^([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])' +
+    r'(\.([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9]))*$'
+)
+
+# Ports canonical_key leaves out of a URL
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Suspicious patterns, combined into a single search
+SUSPICIOUS_REGEX = re.compile('|'.join([
+    r'\.\./',  # Directory traversal
+    r'%00',    # Null byte
+    r'%0[dD]', # CR
+    r'%0[aA]', # LF
+    r'<script', # XSS attempt
+    r'javascript:', # XSS attempt
+]), re.IGNORECASE)
+
 
 def validate_url(url, allow_private=True, require_scheme=True):
     """
@@ -65,11 +84,7 @@ def validate_url(url, allow_private=True, require_scheme=True):
         except ValueError:
             # Not an IP, check as hostname
             # Basic hostname validation
-            hostname_regex = re.compile(
-                r'^([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])' +
-                r'(\.([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9]))*$'
-            )
-            if not hostname_regex.match(hostname):
+            if not HOSTNAME_REGEX.match(hostname):
                 return False, f"Invalid hostname format: {hostname}", None
         
         # Validate port if specified
@@ -78,18 +93,8 @@ def validate_url(url, allow_private=True, require_scheme=True):
                 return False, f"Invalid port number: {parsed.port}", None
         
         # Check for suspicious patterns
-        suspicious_patterns = [
-            r'\.\./',  # Directory traversal
-            r'%00',    # Null byte
-            r'%0[dD]', # CR
-            r'%0[aA]', # LF
-            r'<script', # XSS attempt
-            r'javascript:', # XSS attempt
-        ]
-        
-        for pattern in suspicious_patterns:
-            if re.search(pattern, url, re.IGNORECASE):
-                return False, f"URL contains suspicious pattern", None
+        if SUSPICIOUS_REGEX.search(url):
+            return False, f"URL contains suspicious pattern", None
         
         # Reconstruct normalized URL
         normalized = urlunparse(parsed)
@@ -100,6 +105,46 @@ def validate_url(url, allow_private=True, require_scheme=True):
         return False, f"Invalid URL format: {str(e)}", None
 
 
+def canonical_key(url):
+    """
+    Key identifying the page a target URL would capture
+    
+    Scheme and host are lowercased, default ports dropped, an empty path
+    becomes '/' and fragments are ignored, so http://Host:80, host and
+    HTTP://host/ all share one key. Bare targets on 443/8443 are https, as
+    they are captured.
+    
+    Args:
+        url (str): Target URL, with or without a scheme
+    
+    Returns:
+        str: Canonical key
+    """
+    url = url.strip()
+    if '://' not in url:
+        # The scheme HTTPTableObject.remote_system gives a bare target
+        if ':8443' in url or ':443' in url:
+            url = 'https://' + url
+        else:
+            url = 'http://' + url
+    try:
+        parsed = urlsplit(url)
+        scheme = parsed.scheme.lower()
+        host = parsed.hostname or ''
+        port = parsed.port
+    except ValueError:
+        # Malformed, only exact duplicates are caught
+        return url
+    if ':' in host:
+        host = '[' + host + ']'
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        host += ':' + str(port)
+    key = scheme + '://' + host + (parsed.path or '/')
+    if parsed.query:
+        key += '?' + parsed.query
+    return key
+
+
 def validate_url_list(urls, allow_private=True, require_scheme=True):
     """
     Validate a list of URLs
@@ -126,6 +171,28 @@ def validate_url_list(urls, allow_private=True, require_scheme=True):
     return valid_urls, invalid_urls
 
 
+def find_invalid_urls(urls, allow_private=True, require_scheme=True):
+    """
+    Validate a chunk of URLs, keeping only the failures
+    
+    A module level function so it can be shipped to a process pool.
+    
+    Args:
+        urls (list): URLs to validate
+        allow_private (bool): Whether to allow private/local IPs
+        require_scheme (bool): Whether URLs must have http/https scheme
+    
+    Returns:
+        list: (url, error) tuples for the invalid URLs
+    """
+    invalid_urls = []
+    for url in urls:
+        is_valid, error, _ = validate_url(url, allow_private, require_scheme)
+        if not is_valid:
+            invalid_urls.append((url, error))
+    return invalid_urls
+
+
 def validate_file_path(path, must_exist=False, allow_directory_traversal=False):
     """
     Validate a file path for safety
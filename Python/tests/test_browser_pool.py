@@ -0,0 +1,85 @@
+import queue
+from argparse import Namespace
+
+from modules import browser_pool
+from modules.browser_pool import TabPool
+
+
+class FakeSwitch(object):
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current_window_handle = handle
+
+    def new_window(self, kind):
+        handle = 'tab{0}'.format(len(self.driver.window_handles))
+        self.driver.window_handles.append(handle)
+        self.driver.current_window_handle = handle
+
+
+class FakeDriver(object):
+
+    """Tabs whose pages report loading for a few readiness probes"""
+
+    def __init__(self, load_probes=3):
+        self.window_handles = ['tab0']
+        self.current_window_handle = 'tab0'
+        self.switch_to = FakeSwitch(self)
+        self.load_probes = load_probes
+        self.pages = {}
+
+    def get(self, url):
+        self.pages[self.current_window_handle] = [url, 0]
+
+    def get_log(self, kind):
+        return []
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {'frameTree': {'frame': {'id': self.current_window_handle}}}
+
+    def execute_script(self, script):
+        page = self.pages.get(self.current_window_handle, ['about:blank', 0])
+        page[1] += 1
+        if page[0] != 'about:blank' and page[1] > self.load_probes:
+            return {'location': page[0], 'readyState': 'complete',
+                    'painted': True, 'quietMs': 10000}
+        return {'location': page[0], 'readyState': 'loading'}
+
+
+class Target(object):
+
+    def __init__(self, url):
+        self.remote_system = url
+        self.error_state = None
+
+
+def test_more_targets_than_tabs(monkeypatch):
+    monkeypatch.setattr(browser_pool, 'POLL_INTERVAL', 0)
+    monkeypatch.setattr(browser_pool, 'finish_capture',
+                        lambda *args, **kwargs: None)
+    cli = Namespace(timeout=30, delay=0, ready_timeout=30, header_source='browser')
+    total = 5
+    # Like dispatch_targets, the None sentinel is only queued once every
+    # target has finished
+    targets = queue.Queue()
+    for i in range(total):
+        targets.put(Target('http://host{0}'.format(i)))
+    finished = []
+
+    def next_target(block=True):
+        # A blocking get that waits with pages still loading never returns
+        return targets.get(block, 5)
+
+    def on_done(target):
+        finished.append(target)
+        if len(finished) == total:
+            targets.put(None)
+
+    pool = TabPool(cli, FakeDriver(), 3)
+    pool.run(next_target, on_done)
+
+    assert sorted(t.remote_system for t in finished) == \
+        ['http://host{0}'.format(i) for i in range(total)]
+    assert all(t.error_state is None for t in finished)
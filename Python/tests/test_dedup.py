@@ -0,0 +1,53 @@
+from argparse import Namespace
+
+import pytest
+
+from modules.db_manager import DB_Manager
+from modules.validation import canonical_key
+
+
+@pytest.fixture
+def dbm(tmp_path):
+    manager = DB_Manager(str(tmp_path / 'ew.db'))
+    manager.open_connection()
+    manager.initialize_db()
+    yield manager
+    manager.close()
+
+
+def stored_targets(dbm):
+    return [row['remote_system'] for row in dbm.connection.execute(
+        'SELECT remote_system FROM http ORDER BY id')]
+
+
+@pytest.mark.parametrize('variants', [
+    ['http://host:80', 'host', 'HTTP://host/', 'http://HOST', 'host:80'],
+    ['https://host', 'https://host:443', 'HTTPS://Host:443/', 'host:443'],
+])
+def test_canonical_key_collapses_default_spellings(variants):
+    assert len(set(canonical_key(url) for url in variants)) == 1
+
+
+def test_canonical_key_keeps_distinct_pages():
+    urls = ['http://host', 'https://host', 'http://host:8080', 'http://host/app',
+            'http://other']
+    assert len(set(canonical_key(url) for url in urls)) == len(urls)
+
+
+def test_create_http_objects_skips_duplicates(dbm, tmp_path, capsys):
+    cli = Namespace(d=str(tmp_path), difference=50)
+    targets = ['http://host:80', 'host', 'HTTP://host/',
+               'https://host', 'https://host:443', 'HTTPS://Host:443/',
+               'http://host:8080']
+    assert dbm.create_http_objects(targets, cli) == 3
+    assert stored_targets(dbm) == ['http://host', 'https://host', 'http://host:8080']
+    assert '[*] Skipped 4 duplicate targets' in capsys.readouterr().out
+
+
+def test_duplicates_of_earlier_runs_are_skipped(dbm, tmp_path, capsys):
+    cli = Namespace(d=str(tmp_path), difference=50)
+    dbm.create_http_objects(['host'], cli)
+    capsys.readouterr()
+    assert dbm.create_http_objects(['http://host:80', 'host2'], cli) == 1
+    assert stored_targets(dbm) == ['http://host', 'http://host2']
+    assert '[*] Skipped 1 duplicate targets' in capsys.readouterr().out
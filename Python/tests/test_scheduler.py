@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from modules.db_manager import Target
+from modules.scheduler import HostScheduler
+
+# Seconds each request is held open, long enough for overlaps to show
+HOLD = 0.05
+
+
+class Tracker(object):
+
+    """Requests seen by every server, by the address they arrived on"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.starts = []
+        self.in_flight = {}
+        self.peak = {}
+
+    def begin(self, group):
+        with self.lock:
+            self.starts.append((time.time(), group))
+            self.in_flight[group] = self.in_flight.get(group, 0) + 1
+            self.peak[group] = max(self.peak.get(group, 0), self.in_flight[group])
+
+    def end(self, group):
+        with self.lock:
+            self.in_flight[group] -= 1
+
+
+@pytest.fixture
+def serve():
+    """Start HTTP servers on (address, free port), returns their base URLs
+
+    Requests are tracked under their address, and also under 'all' so the
+    concurrency of several servers together can be checked.
+    """
+    tracker = Tracker()
+    servers = []
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            address = self.server.server_address[0]
+            for group in (address, 'all'):
+                tracker.begin(group)
+            time.sleep(HOLD)
+            for group in (address, 'all'):
+                tracker.end(group)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    def start(*addresses):
+        urls = []
+        for address in addresses:
+            server = ThreadingHTTPServer((address, 0), Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            urls.append('http://{0}:{1}/'.format(address, server.server_address[1]))
+        return tracker, urls
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def run_scan(hosts, urls, workers):
+    """Capture urls through hosts the way dispatch_targets does
+
+    Worker threads take ids off their own queue, request the URL and report
+    back; the scheduler frees the host's slot once the id is done.
+    """
+    targets = dict((rowid, Target(rowid, url, None))
+                   for rowid, url in enumerate(urls, 1))
+    for target in targets.values():
+        hosts.put(target)
+    queues = dict(('worker{0}'.format(i), queue.Queue()) for i in range(workers))
+    done = queue.Queue()
+    # Keep proxies from the environment out of it
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def worker(work):
+        while True:
+            rowid = work.get()
+            if rowid is None:
+                return
+            opener.open(targets[rowid].remote_system, timeout=10).read()
+            done.put(rowid)
+
+    threads = [threading.Thread(target=worker, args=(work,))
+               for work in queues.values()]
+    for thread in threads:
+        thread.start()
+    finished = 0
+    deadline = time.time() + 30
+    while finished < len(targets) and time.time() < deadline:
+        hosts.dispatch(queues, 1)
+        try:
+            hosts.done(done.get(timeout=0.01))
+            finished += 1
+        except queue.Empty:
+            pass
+    for work in queues.values():
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    assert finished == len(targets)
+
+
+def test_dispatch_balances_workers_and_takes_back():
+    hosts = HostScheduler()
+    for rowid in range(1, 6):
+        hosts.put(Target(rowid, 'http://host{0}'.format(rowid), None))
+    queues = {'a': queue.Queue(), 'b': queue.Queue()}
+    assert hosts.dispatch(queues, 2) == 4
+    assert queues['a'].qsize() == queues['b'].qsize() == 2
+    # Full workers get nothing more until they report back
+    assert hosts.dispatch(queues, 2) == 0
+    lost = sorted(queues['a'].queue)
+    hosts.done(lost[0])
+    assert [target.id for target in hosts.take_back('a')] == lost[1:]
+    assert hosts.owner(lost[1]) is None
+    assert hosts.owner(queues['b'].queue[0]) == 'b'
+    # What was taken back is handed out again
+    hosts.put(Target(lost[1], 'http://host{0}'.format(lost[1]), None))
+    assert hosts.dispatch({'c': queue.Queue()}, 2) == 2
+
+
+def test_max_per_host_caps_concurrency(serve):
+    # Two ports on one box are one host
+    tracker, urls = serve('127.0.0.1', '127.0.0.1')
+    run_scan(HostScheduler(max_per_host=2), urls * 6, workers=8)
+    assert tracker.peak['127.0.0.1'] == 2
+
+
+def test_unlimited_hosts_run_concurrently(serve):
+    tracker, urls = serve('127.0.0.1')
+    run_scan(HostScheduler(), urls * 6, workers=6)
+    assert tracker.peak['127.0.0.1'] > 2
+
+
+def test_round_robin_across_hosts(serve):
+    tracker, urls = serve('127.0.0.1', '127.0.0.2', '127.0.0.3')
+    # Queued host by host, captured one at a time
+    run_scan(HostScheduler(), [url for url in urls for _ in range(4)], workers=1)
+    order = [group for _, group in tracker.starts if group != 'all']
+    assert order == ['127.0.0.1', '127.0.0.2', '127.0.0.3'] * 4
+
+
+def test_per_subnet_groups_by_24(serve):
+    tracker, urls = serve('127.0.0.1', '127.0.0.2', '127.0.1.1')
+    run_scan(HostScheduler(max_per_host=1, subnet=True), urls * 4, workers=6)
+    # Both 127.0.0.x servers share one slot, never overlapping...
+    shared = sorted((start, group) for start, group in tracker.starts
+                    if group in ('127.0.0.1', '127.0.0.2'))
+    gaps = [b[0] - a[0] for a, b in zip(shared, shared[1:])]
+    assert min(gaps) >= HOLD * 0.9
+    # ...while the other /24 runs alongside them
+    assert tracker.peak['all'] == 2
+
+
+def test_without_per_subnet_addresses_are_separate(serve):
+    tracker, urls = serve('127.0.0.1', '127.0.0.2')
+    run_scan(HostScheduler(max_per_host=1), urls * 4, workers=4)
+    assert tracker.peak['all'] == 2
+
+
+def test_jitter_spaces_requests_to_a_host(serve):
+    interval = 0.2
+    tracker, urls = serve('127.0.0.1', '127.0.0.2')
+    run_scan(HostScheduler(interval=interval), urls * 4, workers=8)
+    for address in ('127.0.0.1', '127.0.0.2'):
+        starts = [start for start, group in tracker.starts if group == address]
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+        # The refill is randomized to 70-100% of the interval
+        assert min(gaps) >= interval * 0.7 - 0.02
+        assert max(gaps) <= interval + 0.15
+    # Waiting on one host's bucket does not hold back the other
+    first = dict((group, start) for start, group in reversed(tracker.starts))
+    assert abs(first['127.0.0.1'] - first['127.0.0.2']) < interval * 0.5
@@ -0,0 +1,146 @@
+import multiprocessing
+import queue
+import time
+from argparse import Namespace
+
+import pytest
+
+from modules.db_manager import DB_Manager
+from modules.db_writer import WriterClient
+from modules.scheduler import HostScheduler
+from modules.supervisor import WorkerSupervisor
+
+
+class FakeProcess(object):
+
+    """Stands in for a worker Process, dies when told to"""
+
+    def __init__(self, name):
+        self.name = name
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def terminate(self):
+        self.exitcode = -15
+
+    def join(self, timeout=None):
+        pass
+
+
+@pytest.fixture
+def dbm(tmp_path):
+    manager = DB_Manager(str(tmp_path / 'ew.db'))
+    manager.open_connection()
+    manager.initialize_db()
+    manager.create_http_objects(['http://host{0}'.format(i) for i in range(1, 5)],
+                                Namespace(d=str(tmp_path), difference=50))
+    yield manager
+    manager.close()
+
+
+class Records(queue.Queue):
+
+    """Records queue for the supervisor's writes, committed on flush()"""
+
+    def __init__(self, dbm):
+        queue.Queue.__init__(self)
+        self.dbm = dbm
+
+    def flush(self):
+        records = []
+        while not self.empty():
+            records.append(self.get())
+        self.dbm.write_records(records)
+
+
+def start_scan(dbm, max_retries=1):
+    started = []
+
+    def start_worker():
+        w = FakeProcess('worker{0}'.format(len(started) + 1))
+        started.append(w)
+        return w, queue.Queue()
+
+    records = Records(dbm)
+    supervisor = WorkerSupervisor(dbm, WriterClient(records), start_worker, 2,
+                                  max_retries)
+    records.flush()
+    hosts = HostScheduler()
+    for target in dbm.iter_incomplete_targets():
+        hosts.put(target)
+    hosts.dispatch(supervisor.queues, 2)
+    return supervisor, hosts, records, started
+
+
+def row(dbm, rowid):
+    return dbm.connection.execute(
+        'SELECT complete, error_state, retries, claimed_by FROM http WHERE id=?',
+        (rowid,)).fetchone()
+
+
+def test_lost_worker_targets_are_rescheduled(dbm):
+    supervisor, hosts, records, started = start_scan(dbm)
+    held = sorted(supervisor.queues['worker1'].queue)
+    # It started on the first target, the second was still in its queue
+    dbm.write_records([('claim', held[0], 'worker1', time.time() + 600)])
+    started[0].exitcode = 1
+    counter = multiprocessing.Value('i', 0)
+
+    assert supervisor.check(hosts, counter, now=time.time() + 10) == 2
+    records.flush()
+    assert row(dbm, held[0])['retries'] == 1
+    assert row(dbm, held[0])['claimed_by'] is None
+    assert row(dbm, held[1])['retries'] == 0
+    assert counter.value == 0
+    # A replacement took its place, and gets the targets back
+    assert sorted(supervisor.queues) == ['worker2', 'worker3']
+    assert hosts.dispatch(supervisor.queues, 2) == 2
+    assert sorted(supervisor.queues['worker3'].queue) == held
+
+
+def test_targets_reported_done_are_not_taken_back(dbm):
+    supervisor, hosts, records, started = start_scan(dbm)
+    held = sorted(supervisor.queues['worker1'].queue)
+    events = queue.Queue()
+    # Finished the first target, then died before it was seen here
+    events.put(('done', held[0]))
+    started[0].exitcode = 1
+
+    def drain():
+        while not events.empty():
+            hosts.done(events.get()[1])
+
+    counter = multiprocessing.Value('i', 0)
+    assert supervisor.check(hosts, counter, drain, now=time.time() + 10) == 1
+    assert hosts.dispatch(supervisor.queues, 2) == 1
+    assert list(supervisor.queues['worker3'].queue) == [held[1]]
+
+
+def test_crashing_target_fails_after_its_retries(dbm):
+    supervisor, hosts, records, started = start_scan(dbm, max_retries=0)
+    held = sorted(supervisor.queues['worker1'].queue)
+    dbm.write_records([('claim', held[0], 'worker1', time.time() + 600)])
+    started[0].exitcode = 1
+    counter = multiprocessing.Value('i', 0)
+
+    supervisor.check(hosts, counter, now=time.time() + 10)
+    records.flush()
+    assert counter.value == 1
+    assert row(dbm, held[0])['complete'] == 1
+    assert row(dbm, held[0])['error_state'] == 'Driver Crashed'
+    assert hosts.dispatch(supervisor.queues, 2) == 1
+
+
+def test_hung_worker_is_killed(dbm):
+    supervisor, hosts, records, started = start_scan(dbm)
+    held = sorted(supervisor.queues['worker2'].queue)
+    dbm.write_records([('claim', held[0], 'worker2', time.time() - 1)])
+    counter = multiprocessing.Value('i', 0)
+
+    assert supervisor.check(hosts, counter, now=time.time() + 10) == 2
+    records.flush()
+    assert started[1].exitcode == -15
+    assert row(dbm, held[0])['retries'] == 1
+    assert sorted(supervisor.queues) == ['worker1', 'worker3']